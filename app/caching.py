@@ -0,0 +1,306 @@
+# caching.py - persistent on-disk caches that let repeated uploads skip work
+from core.common import *
+from app.utils import DATA_VERSION_FILE
+import hashlib
+import shutil
+import threading
+from collections import OrderedDict
+import shapely
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dash_extensions.enrich import FileSystemBackend
+
+# --- track cache parameters ---
+# parsed, projected (EPSG:3812) and simplified tracks, one GeoParquet shard per GPX file
+TRACK_CACHE_FOLDER = os.path.join(CACHE_FOLDER, "tracks")
+# shards are kept in a subfolder per parsing parameters, those of other parameters are removed
+TRACK_CACHE_PARAMS = f"s{SIMPLIFY_TOLERANCE_M}_m{DECIMATE_MIN_SPACING_M}"
+TRACK_SHARD_FOLDER = os.path.join(TRACK_CACHE_FOLDER, TRACK_CACHE_PARAMS)
+# total size of the shards kept on disk; least recently used shards are evicted first
+TRACK_CACHE_MAX_BYTES = 512 * 1024**2
+# columns stored in a shard (file name dependent columns are rebuilt on load)
+TRACK_CACHE_COLUMNS = [
+    "track_idx", "track_name", "track_date", "geometry", "activity_type", "track_fingerprint"
+]
+
+# --- match cache parameters ---
+# matched segments per track, one Parquet shard per track in a folder per network
+# version and matching parameters
+MATCH_CACHE_FOLDER = os.path.join(CACHE_FOLDER, "matches")
+MATCH_CACHE_MAX_BYTES = 256 * 1024**2
+MATCH_CACHE_COLUMNS = [
+    "osm_id", "intersection_length", "overlap_percentage", *OVERLAP_COLUMNS.values(),
+    "track_position_from", "track_position_to"
+]
+
+# --- session results parameters ---
+# processed results of an upload, kept server-side: the browser store only holds a handle
+SESSION_RESULTS_FOLDER = os.path.join(CACHE_FOLDER, "sessions")
+# number of most recent results also kept in memory, served without unpickling
+SESSION_RESULTS_MEMORY_ENTRIES = 4
+# number of results kept on disk, the oldest are removed first
+SESSION_RESULTS_MAX_FILES = 50
+
+class HashingReader:
+    """File-like wrapper that computes the content hash of everything read through it."""
+
+    def __init__(self, f):
+        self._f = f
+        self._hash = hashlib.blake2b(digest_size=16)
+
+    def read(self, size=-1):
+        data = self._f.read(size)
+        self._hash.update(data)
+        return data
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+def track_index(track_uids):
+    """Return the track index within its GPX file from a `track_uid` series."""
+    return track_uids.str.rsplit("__", n=1).str[-1].astype(int)
+
+def _shard_path(digest, folder=TRACK_SHARD_FOLDER):
+    # fan out over subfolders to keep directory listings small
+    return os.path.join(folder, digest[:2], f"{digest}.parquet")
+
+def _write_shard(frame, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # write to a temporary file first so readers never see a partial shard
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    frame.to_parquet(tmp_path, engine="pyarrow", index=False)
+    os.replace(tmp_path, path)
+
+def has_cached_tracks(digest):
+    """Check whether the tracks of a file with this content hash are cached."""
+    return os.path.exists(_shard_path(digest))
+
+def store_cached_tracks(tracks_gdf, digests):
+    """
+    Write one cache shard per content hash.
+
+    Files without valid tracks get an empty shard, so they are skipped next
+    time as well.
+
+    Args:
+        tracks_gdf (GeoDataFrame): Projected and simplified tracks with a
+            `content_hash` column.
+        digests (list): Content hashes of all parsed files.
+    """
+    shards = tracks_gdf.assign(track_idx=track_index(tracks_gdf["track_uid"]))
+    groups = {digest: grp for digest, grp in shards.groupby("content_hash")}
+    empty = shards.iloc[:0]
+    for digest in set(digests):
+        _write_shard(groups.get(digest, empty)[TRACK_CACHE_COLUMNS], _shard_path(digest))
+
+def load_cached_tracks(members, crs="EPSG:3812"):
+    """
+    Load cached tracks for a list of ZIP members.
+
+    Shards are read with pyarrow and their geometries decoded in one go,
+    which avoids parsing the GeoParquet CRS metadata of every shard.
+
+    Args:
+        members (list): (member name, content hash) pairs.
+        crs (str): CRS of the cached geometries.
+
+    Returns:
+        tuple:
+            GeoDataFrame: Cached tracks with their file name dependent columns
+                (`gpx_name`, `track_uid`) rebuilt from the member names.
+            list: Members whose shard has disappeared in the meantime (or
+                lacks a column), to be parsed again.
+    """
+    tables = []
+    gpx_files, digests = [], []
+    missing = []
+    for member, digest in members:
+        path = _shard_path(digest)
+        try:
+            # shards written before a column was added are parsed again as well
+            table = pq.read_table(path).select(TRACK_CACHE_COLUMNS)
+            os.utime(path)  # mark as recently used
+        except (FileNotFoundError, OSError, KeyError):
+            missing.append((member, digest))
+            continue
+        tables.append(table)
+        gpx_files.extend([member] * table.num_rows)
+        digests.extend([digest] * table.num_rows)
+
+    if not gpx_files:
+        return gpd.GeoDataFrame(geometry=[], crs=crs), missing
+
+    df = pa.concat_tables(tables, promote_options="default").to_pandas()
+    df["gpx_name"] = [os.path.basename(member) for member in gpx_files]
+    df["track_uid"] = pd.Series(gpx_files) + "__" + df["track_idx"].astype(str)
+    df["content_hash"] = digests
+    df["geometry"] = shapely.from_wkb(df["geometry"].to_numpy())
+    return gpd.GeoDataFrame(df.drop(columns="track_idx"), geometry="geometry", crs=crs), missing
+
+def _evict(folder, max_bytes):
+    """Delete least recently used files in `folder` until it fits in `max_bytes`."""
+    entries = []
+    for root, _, files in os.walk(folder):
+        for fname in files:
+            path = os.path.join(root, fname)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+def evict_cached_tracks(max_bytes=TRACK_CACHE_MAX_BYTES):
+    """
+    Delete the track shards of other parsing parameters, then the least
+    recently used shards until the cache fits in `max_bytes`.
+    """
+    if os.path.isdir(TRACK_CACHE_FOLDER):
+        for name in os.listdir(TRACK_CACHE_FOLDER):
+            if name != TRACK_CACHE_PARAMS:
+                shutil.rmtree(os.path.join(TRACK_CACHE_FOLDER, name), ignore_errors=True)
+    _evict(TRACK_CACHE_FOLDER, max_bytes)
+
+# --- match cache ---
+def track_keys(gpx_gdf):
+    """Return the match cache key of each track: file content hash and track index."""
+    return gpx_gdf["content_hash"] + "_" + track_index(gpx_gdf["track_uid"]).astype(str)
+
+def _match_cache_folder(engine):
+    """
+    Return the match cache folder for the current network version and
+    matching parameters, removing those of other network versions.
+    `engine` names the matching engine and its own parameters.
+    """
+    version = DATA_VERSION_FILE.read_text().strip() if DATA_VERSION_FILE.exists() else "unknown"
+    if os.path.isdir(MATCH_CACHE_FOLDER):
+        # matches against an older (or newer) network are never valid again
+        for name in os.listdir(MATCH_CACHE_FOLDER):
+            if not name.startswith(f"{version}_"):
+                shutil.rmtree(os.path.join(MATCH_CACHE_FOLDER, name), ignore_errors=True)
+    # all pairs down to MIN_OVERLAP_FRACTION are cached, whatever the threshold in use
+    distances = "-".join(map(str, BUFFER_DISTANCES_M))
+    params = (
+        f"{engine}_b{BUFFER_DISTANCE_M}_d{distances}_s{SIMPLIFY_TOLERANCE_M}"
+        f"_m{DECIMATE_MIN_SPACING_M}_t{MIN_OVERLAP_FRACTION}"
+    )
+    return os.path.join(MATCH_CACHE_FOLDER, f"{version}_{params}")
+
+def load_cached_matches(keys, engine):
+    """
+    Load the cached matched segments of tracks.
+
+    Args:
+        keys (Iterable): Track keys (see `track_keys`).
+        engine (str): Matching engine and parameters the cached matches
+            were made with (see `get_match_params` in app.geoprocessing).
+
+    Returns:
+        tuple:
+            DataFrame: `track_key` and MATCH_CACHE_COLUMNS of the matched
+                segments of all cached tracks.
+            set: Keys of the cached tracks (also those without any match).
+    """
+    folder = _match_cache_folder(engine)
+    tables, row_keys = [], []
+    hits = set()
+    for key in set(keys):
+        path = _shard_path(key, folder)
+        try:
+            table = pq.read_table(path)
+            os.utime(path)  # mark as recently used
+        except (FileNotFoundError, OSError):
+            continue
+        hits.add(key)
+        tables.append(table.select(MATCH_CACHE_COLUMNS))
+        row_keys.extend([key] * table.num_rows)
+
+    if not row_keys:
+        return pd.DataFrame(columns=["track_key"] + MATCH_CACHE_COLUMNS), hits
+    df = pa.concat_tables(tables, promote_options="default").to_pandas()
+    df.insert(0, "track_key", row_keys)
+    return df, hits
+
+def store_cached_matches(matches, keys, engine):
+    """
+    Write one match cache shard per track.
+
+    Args:
+        matches (DataFrame): Matched segments with `track_key` and
+            MATCH_CACHE_COLUMNS columns.
+        keys (Iterable): Keys of all matched tracks, tracks without any
+            matched segment get an empty shard.
+        engine (str): Matching engine and parameters the matches were
+            made with (see `get_match_params` in app.geoprocessing).
+    """
+    folder = _match_cache_folder(engine)
+    matches = pd.DataFrame(matches[["track_key"] + MATCH_CACHE_COLUMNS])
+    groups = {key: grp for key, grp in matches.groupby("track_key")}
+    empty = matches.iloc[:0]
+    for key in set(keys):
+        _write_shard(groups.get(key, empty)[MATCH_CACHE_COLUMNS], _shard_path(key, folder))
+
+def evict_cached_matches(max_bytes=MATCH_CACHE_MAX_BYTES):
+    """Delete least recently used match shards until the cache fits in `max_bytes`."""
+    _evict(MATCH_CACHE_FOLDER, max_bytes)
+
+# --- session results ---
+class SessionResultsBackend(FileSystemBackend):
+    """
+    Server-side store of `Serverside` callback outputs, in memory with a copy on disk.
+
+    The most recent results are served straight from memory. Every result is
+    also written to disk, where older results remain available after they
+    leave memory, and where other server processes can read them.
+    """
+
+    def __init__(self, cache_dir=SESSION_RESULTS_FOLDER,
+                 memory_entries=SESSION_RESULTS_MEMORY_ENTRIES, threshold=SESSION_RESULTS_MAX_FILES):
+        # results never expire, only the oldest are removed beyond the threshold
+        super().__init__(cache_dir, threshold=threshold, default_timeout=0)
+        self._memory = OrderedDict()
+        self._memory_entries = memory_entries
+        self._lock = threading.Lock()
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self._memory_entries:
+                self._memory.popitem(last=False)
+
+    def set(self, key, value, timeout=None, mgmt_element=False):
+        if mgmt_element:
+            # internal bookkeeping of the file system cache
+            return super().set(key, value, timeout, mgmt_element)
+        with self._lock:
+            # a `Serverside` key identifies one result: don't write it to disk again
+            # when a callback returns the same output once more
+            stored = key in self._memory
+        self._remember(key, value)
+        return True if stored else super().set(key, value, timeout)
+
+    def get(self, key, ignore_expired=False):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+        value = super().get(key, ignore_expired=ignore_expired)
+        if value is not None:
+            self._remember(key, value)
+        return value
+
+    def has(self, key):
+        with self._lock:
+            if key in self._memory:
+                return True
+        return super().has(key)
@@ -6,7 +6,8 @@ import json
 import base64
 import threading
 import psutil
-from dash import no_update, Dash, html, dcc, Output, Input, State, dash_table
+from dash import no_update, html, dcc, Output, Input, State, dash_table
+from dash_extensions.enrich import DashProxy, Serverside, ServersideOutputTransform
 import dash_bootstrap_components as dbc
 import dash_leaflet as dl
 from dash.exceptions import PreventUpdate
@@ -22,12 +23,22 @@ _processing_thread = None
 # --- load data ---
 bike_network_seg = gpd.read_parquet(MULTILINE_PROJECTED_PARQUET_PATH)
 bike_network_node = gpd.read_parquet(POINT_PROJECTED_PARQUET_PATH)
+# spatial index and osm_id lookups, shared by all processing jobs and callbacks
+network_index = get_network_index(bike_network_seg, bike_network_node)
+# warm worker pool for parsing and matching, reused by every upload
+start_worker_pool(bike_network_seg)
 with open(MULTILINE_GEOJSON_PATH , "r") as f:
    geojson_network = json.load(f)
 
 # --- initialize app ---
 # Themes: see https://www.dash-bootstrap-components.com/docs/themes/explorer/
-app = Dash(__name__, external_stylesheets=[dbc.themes.ZEPHYR])
+# processed results stay on the server, callbacks exchange them through a handle
+# (see `SessionResultsBackend`)
+app = DashProxy(
+    __name__,
+    transforms=[ServersideOutputTransform(backends=[SessionResultsBackend()])],
+    external_stylesheets=[dbc.themes.ZEPHYR]
+)
 server = app.server
 
 # Check memory usage before processing
@@ -199,6 +210,34 @@ app.layout = dbc.Container(
                                 )
                             ]),
                             width="3"
+                        ),
+                        dbc.Col(
+                            html.Div([
+                                dbc.Label("Minimum Overlap", html_for="overlap-threshold-slider"),
+                                dcc.Slider(
+                                    id="overlap-threshold-slider",
+                                    min=MIN_OVERLAP_FRACTION,
+                                    max=1,
+                                    step=0.05,
+                                    value=INTERSECT_THRESHOLD,
+                                    marks={i / 4: f"{i * 25}%" for i in range(1, 5)},
+                                    tooltip={"always_visible": True}
+                                )
+                            ]),
+                            width="2"
+                        ),
+                        dbc.Col(
+                            html.Div([
+                                dbc.Label("Buffer Distance", html_for="buffer-distance-radio"),
+                                dcc.RadioItems(
+                                    id="buffer-distance-radio",
+                                    options=[{"label": f"{d} m", "value": d} for d in get_match_distances()],
+                                    value=BUFFER_DISTANCE_M,
+                                    inputStyle={"margin-right": "5px"},
+                                    labelStyle={"display": "inline-block", "margin-right": "10px"},
+                                )
+                            ]),
+                            width="auto"
                         )
                     ], className="mb-2", align="center"),
                     # Map
@@ -430,12 +469,18 @@ def start_processing(_, filename, upload_ready):
     progress_state["previous-task"] = ""
     progress_state["show-dots"] = True
     progress_state["dot-count"] = 0
+    progress_state["skipped-duplicates"] = 0
 
     zip_file_path = os.path.join(UPLOAD_FOLDER, filename)
 
     def worker():
         progress_state["running"] = True
-        all_segments, all_nodes, all_gpx = process_gpx_zip(zip_file_path, bike_network_seg, bike_network_node)
+        # keep every overlap down to MIN_OVERLAP_FRACTION at any buffer distance, the
+        # threshold slider and buffer distance radio filter them
+        all_segments, all_nodes, all_gpx = process_gpx_zip(
+            zip_file_path, bike_network_seg, bike_network_node,
+            min_overlap=MIN_OVERLAP_FRACTION, buffer_distance=None
+        )
 
         all_segments = all_segments.to_crs(epsg=4326) if not all_segments.empty else gpd.GeoDataFrame()
         all_nodes = all_nodes.to_crs(epsg=4326) if not all_nodes.empty else gpd.GeoDataFrame()
@@ -444,23 +489,34 @@ def start_processing(_, filename, upload_ready):
         segments_file_path = os.path.join(STATIC_FOLDER, "all_matched_segments_wgs84.geojson")
         nodes_file_path = os.path.join(STATIC_FOLDER, "all_matched_nodes_wgs84.geojson")
         gpx_file_path = os.path.join(STATIC_FOLDER, "all_gpx_wgs84.geojson")
-        all_segments.to_file(segments_file_path, driver="GeoJSON")
-        all_nodes.to_file(nodes_file_path, driver="GeoJSON")
+        # downloads use the default threshold
+        if not all_segments.empty:
+            all_segments[all_segments["overlap_percentage"] >= INTERSECT_THRESHOLD].to_file(
+                segments_file_path, driver="GeoJSON"
+            )
+            all_nodes[all_nodes["overlap_percentage"] >= INTERSECT_THRESHOLD].to_file(
+                nodes_file_path, driver="GeoJSON"
+            )
+        else:
+            all_segments.to_file(segments_file_path, driver="GeoJSON")
+            all_nodes.to_file(nodes_file_path, driver="GeoJSON")
         all_gpx.to_file(gpx_file_path, driver="GeoJSON")
 
         zip_name = create_result_zip(segments_file_path, nodes_file_path, gpx_file_path)
 
-        # Only update store when processing is done
-        progress_state["store_data"] = {
-            "segments": all_segments.__geo_interface__,
-            "nodes": all_nodes.__geo_interface__,
-            "gpx": all_gpx.__geo_interface__,
-            # must be relative to app root here for Dash download link
-            "download_href": os.path.join("static", zip_name)
-        }
+        # Only update store when processing is done; the results stay server-side,
+        # indexed by date (see `ResultsIndex`), the store only receives a handle to them
+        progress_state["store_data"] = Serverside(
+            ResultsIndex(all_segments, all_nodes, all_gpx) if not all_segments.empty else None
+        )
+        # must be relative to app root here for Dash download link
+        progress_state["download_href"] = os.path.join("static", zip_name)
         progress_state["pct"] = 100
         progress_state["btn-disabled"] = False
         progress_state["current-task"] = f"Finished processing {filename}"
+        n_duplicates = progress_state.get("skipped-duplicates", 0)
+        if n_duplicates:
+            progress_state["current-task"] += f" ({n_duplicates} duplicate activities skipped)"
         # disable polling
         progress_state["running"] = False
 
@@ -487,7 +543,7 @@ def start_processing(_, filename, upload_ready):
     Input("processing-started", "data"), # will (re)activate the poller
     prevent_initial_call=True
 )
-def update_progress(*_):
+def update_progress(_n_intervals, _processing_started):
     # reset or increment dots
     current_task = progress_state.get("current-task", "")
     prev_task = progress_state.get("previous-task", None)
@@ -504,7 +560,7 @@ def update_progress(*_):
     poller_disabled = not progress_state.get("running", True)
     pct = progress_state.get("pct", 0)
     label = f"{pct}%" if pct >= 5 else ""
-    href = progress_state.get("store_data", {}).get("download_href")
+    href = progress_state.get("download_href")
     style = {"width": "40%", "display": "block" if pct >= 100 else "none"}
 
     # Only update store when ready
@@ -515,46 +571,66 @@ def update_progress(*_):
 
     return outputs
 
+def filter_results(store, start_date, end_date, min_overlap, buffer_distance):
+    """
+    Aggregate the matched segments and nodes by date and minimum overlap (at the chosen buffer distance).
+
+    Returns:
+        tuple | None: Aggregated segments, nodes and track GeoJSON (see `ResultsIndex.filter`),
+            or None without results or with invalid dates.
+    """
+    # server-side ResultsIndex, None when nothing matched
+    if not store:
+        return None
+
+    try:
+        start = pd.to_datetime(start_date).date() if start_date else store.first_date
+        end = pd.to_datetime(end_date).date() if end_date else store.last_date
+    except Exception:
+        return None
+
+    min_overlap = min_overlap if min_overlap is not None else INTERSECT_THRESHOLD
+    # overlaps at every buffer distance are in the store, pick the chosen one
+    overlap_col = OVERLAP_COLUMNS.get(buffer_distance, "overlap_percentage")
+    return store.filter(start, end, min_overlap, overlap_col)
+
+# KPIs have their own callback: they don't wait for the (much larger) map data
 @app.callback(
     Output("kpi-totsegments", "children"),
     Output("kpi-totnodes", "children"),
     Output("kpi-totlength", "children"),
-    Output("geojson-store-filtered", "data"),
     Input("geojson-store-full", "data"),
     Input("start-date-picker", "date"),
     Input("end-date-picker", "date"),
+    Input("overlap-threshold-slider", "value"),
+    Input("buffer-distance-radio", "value"),
 )
-def filter_data(store, start_date, end_date):
-    """Filter bike segments and nodes by date and compute KPIs."""
-    
-    if not store or not store.get("segments", {}).get("features"):
-        return None, None, None, {}
-
-    gdf_segments = gpd.GeoDataFrame.from_features(store["segments"]["features"])
-    gdf_nodes = gpd.GeoDataFrame.from_features(store["nodes"]["features"])
-    gdf_gpx = gpd.GeoDataFrame.from_features(store["gpx"]["features"])
-
-    gdf_segments["track_date"] = pd.to_datetime(gdf_segments["track_date"]).dt.date
-    gdf_nodes["track_date"] = pd.to_datetime(gdf_nodes["track_date"]).dt.date
-    gdf_gpx["track_date"] = pd.to_datetime(gdf_gpx["track_date"]).dt.date
-
-    try:
-        start = pd.to_datetime(start_date).date() if start_date else gdf_segments["track_date"].min()
-        end = pd.to_datetime(end_date).date() if end_date else gdf_segments["track_date"].max()
-    except Exception:
-        return None, None, None, {}
+def update_kpis(store, start_date, end_date, min_overlap, buffer_distance):
+    """Compute the KPIs of the filtered bike segments and nodes."""
+    results = filter_results(store, start_date, end_date, min_overlap, buffer_distance)
+    if results is None:
+        return None, None, None
 
-    seg_mask = (gdf_segments["track_date"] >= start) & (gdf_segments["track_date"] <= end)
-    node_mask = (gdf_nodes["track_date"] >= start) & (gdf_nodes["track_date"] <= end)
-    gpx_mask = (gdf_gpx["track_date"] >= start) & (gdf_gpx["track_date"] <= end)
-
-    gdf_segments_filtered = gdf_segments.loc[seg_mask].copy()
-    gdf_nodes_filtered = gdf_nodes.loc[node_mask].copy()
-    gdf_gpx_filtered = gdf_gpx.loc[gpx_mask].copy()
+    agg_seg, agg_nodes, _ = results
+    total_segments = len(agg_seg)
+    total_nodes = len(agg_nodes)
+    total_length = round(agg_seg["length_km"].round(2).sum(), 2)
+    return total_segments, total_nodes, total_length
 
-    gdf_segments_filtered["track_date"] = pd.to_datetime(gdf_segments_filtered["track_date"])
-    gdf_nodes_filtered["track_date"] = pd.to_datetime(gdf_nodes_filtered["track_date"])
-    gdf_gpx_filtered["track_date"] = pd.to_datetime(gdf_gpx_filtered["track_date"])
+@app.callback(
+    Output("geojson-store-filtered", "data"),
+    Input("geojson-store-full", "data"),
+    Input("start-date-picker", "date"),
+    Input("end-date-picker", "date"),
+    Input("overlap-threshold-slider", "value"),
+    Input("buffer-distance-radio", "value"),
+)
+def filter_data(store, start_date, end_date, min_overlap, buffer_distance):
+    """Filter bike segments and nodes by date and minimum overlap (at the chosen buffer distance) for the map and tables."""
+    results = filter_results(store, start_date, end_date, min_overlap, buffer_distance)
+    if results is None:
+        return {}
+    agg_seg, agg_nodes, gpx_filtered = results
 
     # Helper function for building tooltip
     def build_tooltip(label_prefix, label_value, kpi_dict):
@@ -573,24 +649,9 @@ def filter_data(store, start_date, end_date):
             )
         return "<br>".join(tooltip_lines)
 
-    # -- Aggregate segments --
-    # Use dropna=False to keep groups with missing keys e.g. missing osm_id_from/to
-    agg_seg = gdf_segments_filtered.groupby((["ref", "osm_id", "osm_id_from", "osm_id_to"]), dropna=False).agg(
-        length_km=("length_km", "max"),
-        count_track=("track_uid", "nunique"),
-        max_overlap_percentage=("overlap_percentage", "max"),
-        first_date=("track_date", "min"),
-        last_date=("track_date", "max"),
-        # preserve geometry
-        geometry=("geometry", "first")
-    ).reset_index()
-
-    agg_seg = gpd.GeoDataFrame(agg_seg, geometry="geometry", crs=gdf_segments_filtered.crs)
-    # Apply formatting and sort result
+    # -- Format segments --
     agg_seg["length_km"] = agg_seg["length_km"].round(2)
     agg_seg["max_overlap_percentage"] = agg_seg["max_overlap_percentage"].round(2)
-    agg_seg["first_date"] = agg_seg["first_date"].dt.strftime("%Y-%m-%d")
-    agg_seg["last_date"] = agg_seg["last_date"].dt.strftime("%Y-%m-%d")
     agg_seg = agg_seg.sort_values("count_track", ascending=False)
 
     # Add tooltip
@@ -609,20 +670,7 @@ def filter_data(store, start_date, end_date):
         axis=1
     )
 
-    # -- Aggregate nodes --
-    # Use dropna=False to keep groups with missing keys e.g. missing osm_id_from/to
-    agg_nodes = gdf_nodes_filtered.groupby(["rcn_ref", "osm_id"], dropna=False).agg(
-        count_track=("track_date", "nunique"),
-        first_date=("track_date", "min"),
-        last_date=("track_date", "max"),
-        # preserve geometry
-        geometry=("geometry", "first")
-    ).reset_index()
-    agg_nodes = gpd.GeoDataFrame(agg_nodes, geometry="geometry", crs=gdf_nodes_filtered.crs)
-
-    # Apply formatting and sort result
-    agg_nodes["first_date"] = agg_nodes["first_date"].dt.strftime("%Y-%m-%d")
-    agg_nodes["last_date"] = agg_nodes["last_date"].dt.strftime("%Y-%m-%d")
+    # -- Format nodes --
     agg_nodes = agg_nodes.sort_values("count_track", ascending=False)
 
     # Add tooltip
@@ -639,21 +687,11 @@ def filter_data(store, start_date, end_date):
         axis=1
     )
 
-    # Calculate KPIs
-    total_segments = len(agg_seg)
-    total_nodes = len(agg_nodes)
-    total_length = round(agg_seg["length_km"].sum(), 2)
-
-    return (
-        total_segments,
-        total_nodes,
-        total_length,
-        {
-            "segments": agg_seg.__geo_interface__,
-            "nodes": agg_nodes.__geo_interface__,
-            "gpx": gdf_gpx_filtered.__geo_interface__
-        }
-    )
+    return {
+        "segments": agg_seg.__geo_interface__,
+        "nodes": agg_nodes.__geo_interface__,
+        "gpx": gpx_filtered
+    }
 
 @app.callback(
     Output("layer-segments", "data"),
@@ -736,7 +774,7 @@ def update_tables(filtered_data):
     # also clear selection when user modifies filters
     Input("table-segments-agg", "data"),
 )
-def unselect_all_segments(*_):
+def unselect_all_segments(_n_clicks, _table_data):
     """Clear all selected rows in the segments table when triggered."""
     return []
 
@@ -746,7 +784,7 @@ def unselect_all_segments(*_):
     # also clear selection when user modifies filters
     Input("table-segments-agg", "data"),
 )
-def unselect_all_nodes(*_):
+def unselect_all_nodes(_n_clicks, _table_data):
     """Clear all selected rows in the nodes table when triggered."""
     return []
 
@@ -787,14 +825,9 @@ def highlight_segments(selected_rows, table_data, filtered_data):
     # Get all selected 'ref' values
     ref_values = [table_data[i]["osm_id"] for i in selected_rows]
 
-    # Convert filtered segments to GeoDataFrame
-    gdf_seg = gpd.GeoDataFrame.from_features(filtered_data["segments"]["features"])
-
-    # Filter for the selected segments
-    if not gdf_seg.empty:
-        gdf_highlight = gdf_seg[gdf_seg["osm_id"].isin(ref_values)]
-    else:
-        gdf_highlight = gpd.GeoDataFrame()
+    # Look up the selected segments in the network
+    rows = network_index.segment_positions(ref_values)
+    gdf_highlight = bike_network_seg.iloc[rows[rows >= 0]][["osm_id", "geometry"]].to_crs(epsg=4326)
 
     # Check if filtered DataFrame is empty
     if gdf_highlight.empty:
@@ -822,15 +855,11 @@ def highlight_segments_from_nodes(selected_rows, table_data, filtered_data):
     # Get selected node IDs or refs
     selected_nodes = [table_data[i]["osm_id"] for i in selected_rows]
 
-    # Convert filtered segments to GeoDataFrame
-    gdf_seg = gpd.GeoDataFrame.from_features(filtered_data["segments"]["features"])
-
-    # Filter segments where node_from or node_to is in selected_nodes
-    if not gdf_seg.empty:
-        mask = gdf_seg["osm_id_from"].isin(selected_nodes) | gdf_seg["osm_id_to"].isin(selected_nodes)
-        gdf_highlight = gdf_seg[mask]
-    else:
-        gdf_highlight = gpd.GeoDataFrame()
+    # Segments where node_from or node_to is in selected_nodes, limited to the filtered segments
+    filtered_ids = {f["properties"]["osm_id"] for f in filtered_data["segments"]["features"]}
+    gdf_highlight = bike_network_seg.iloc[network_index.segments_at_nodes(selected_nodes)]
+    gdf_highlight = gdf_highlight[gdf_highlight["osm_id"].isin(filtered_ids)][["osm_id", "geometry"]]
+    gdf_highlight = gdf_highlight.to_crs(epsg=4326)
 
     # Check if filtered DataFrame is empty
     if gdf_highlight.empty:
@@ -1,269 +1,2251 @@
 from core.common import *
+from core.conversion import map_activity_type
+from app.caching import *
+import bisect
+import gzip
+import hashlib
+import itertools
+import numpy as np
+import shapely
 from shapely.geometry import Point, LineString, MultiLineString
-import shutil
 import zipfile
+import psutil
+import pyproj
+from multiprocessing import resource_tracker, shared_memory
 from lxml import etree
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 # import time # for testing optimization: start/stop = time.time() (in s)
 
 # --- concurrency parameters ---
 # Minimum number of files before we even consider parallel parsing
 PARALLEL_MIN_FILES = 200
-# Minimum number of logical CPU cores required to enable parallel parsing (local only)
+# Minimum number of logical CPU cores required to enable parallel parsing
 PARALLEL_MIN_CORES = 2
 # Maximum number of worker processes for parallel GPX parsing
 DEFAULT_MAX_WORKERS = 8
+# Estimated memory of a parse worker: fixed process overhead plus a multiple
+# of the (uncompressed) size of the largest GPX file it may have to hold
+WORKER_BASE_MEMORY_MB = 120
+WORKER_MEMORY_PER_FILE_BYTE = 3
+# Memory kept free for the main process while the parse pool is running
+MEMORY_RESERVE_MB = 300
+# Memory limit (MB) of the host or container, overriding the one detected from the
+# cgroup (e.g. set it on Render, whose free tier has 512 MB whatever the host has)
+MEMORY_LIMIT_ENV = "MEMORY_LIMIT_MB"
+# cgroup v2 and v1 files holding the container memory limit and current usage
+CGROUP_MEMORY_FILES = [
+    ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory.current"),
+    ("/sys/fs/cgroup/memory/memory.limit_in_bytes", "/sys/fs/cgroup/memory/memory.usage_in_bytes"),
+]
+# Target amount of (uncompressed) GPX data per parse task, and the minimum
+# number of tasks per worker so that the pool stays balanced
+PARSE_CHUNK_BYTES = 16 * 1024**2
+PARSE_TASKS_PER_WORKER = 4
+# Hand parsed coordinates from parse workers to the parent through shared memory
+# blocks instead of pickling them through the pool's pipes
+USE_SHARED_MEMORY = True
+# Minimum number of tracks to match before matching in parallel batches
+PARALLEL_MATCH_MIN_TRACKS = 500
+# Estimated memory of a match worker: process overhead plus its private copy of
+# the network index pages it touches (the network itself is inherited)
+MATCH_WORKER_MEMORY_MB = 250
+# Number of track batches per match worker, balanced by vertex count
+MATCH_TASKS_PER_WORKER = 4
+
+# --- cache parameters ---
+# Skip parsing of GPX files whose content is already in the on-disk track cache
+USE_TRACK_CACHE = True
+# Skip matching of tracks whose matched segments are in the on-disk match cache
+USE_MATCH_CACHE = True
+
+# --- GPX parsing parameters ---
+GPX_NS = "{http://www.topografix.com/GPX/1/1}"
+GPX_ROOT = GPX_NS + "gpx"
+GPX_TRK = GPX_NS + "trk"
+GPX_TRKSEG = GPX_NS + "trkseg"
+GPX_TRKPT = GPX_NS + "trkpt"
+GPX_NAME = GPX_NS + "name"
+GPX_TYPE = GPX_NS + "type"
+GPX_TIME = GPX_NS + "time"
+EARTH_RADIUS_M = 6_371_008.8
+
+# --- TCX parsing parameters ---
+TCX_NS = "{http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2}"
+TCX_ACTIVITY = TCX_NS + "Activity"
+TCX_TRACKPOINT = TCX_NS + "Trackpoint"
+TCX_POSITION = TCX_NS + "Position"
+TCX_LAT = TCX_NS + "LatitudeDegrees"
+TCX_LON = TCX_NS + "LongitudeDegrees"
+TCX_TIME = TCX_NS + "Time"
+
+# activity files picked up from an uploaded ZIP (TCX is read natively, no conversion,
+# gzipped files are decompressed on the fly by the parse workers)
+ACTIVITY_EXTENSIONS = (".gpx", ".gpx.gz", ".tcx", ".tcx.gz")
+# column order of the per-track metadata tuples and of the track GeoDataFrame
+TRACK_META_COLUMNS = [
+    "gpx_name", "track_name", "track_uid", "track_date", "track_fingerprint", "activity_type"
+]
+TRACK_COLUMNS = [
+    "gpx_name", "track_name", "track_uid", "track_date", "geometry", "activity_type",
+    "track_fingerprint"
+]
+# track columns added to each matched segment and node
+MATCH_TRACK_COLUMNS = ["gpx_name", "track_name", "track_date", "track_uid"]
+# keys of the segments and nodes aggregated over the matched tracks (see `ResultsIndex`)
+SEGMENT_GROUP_COLUMNS = ["ref", "osm_id", "osm_id_from", "osm_id_to"]
+NODE_GROUP_COLUMNS = ["rcn_ref", "osm_id"]
+
+# --- duplicate detection parameters ---
+# Skip tracks recorded more than once (e.g. the same ride in a Strava and a Garmin
+# export): same start time, number of points and coordinates, rounded to this many
+# decimal degrees (about 1 m) to absorb the precision differences between exports
+USE_DUPLICATE_DETECTION = True
+FINGERPRINT_DECIMALS = 5
+
+# --- matching parameters ---
+# Tracks are cut into pieces of about this length (m) before buffering, so that every
+# buffer only overlaps the network segments near it instead of a whole ride's worth
+TRACK_PIECE_LENGTH_M = 2000
+# Matching engine: "buffer" buffers the tracks (every buffer distance), "corridor" tests
+# track vertices against segment corridors buffered beforehand (BUFFER_DISTANCE_M only),
+# "graph" walks each track along the network graph (BUFFER_DISTANCE_M only, ordered nodes)
+MATCH_ENGINE = "buffer"
+# buffer engine: spacing (m) of the segment vertices whose distance to the track gives
+# the overlap at each buffer distance, once the widest buffer has selected the segments
+OVERLAP_SAMPLE_M = 5
+# number of consecutive segment vertices looked up in the spatial index together
+OVERLAP_SAMPLE_RUN = 8
+# corridor and graph engines: spacing (m) of the track vertices tested against the
+# segments, and length (m) of the segment bins counted as covered when a vertex
+# projects onto them
+CORRIDOR_DENSIFY_M = 5
+CORRIDOR_BIN_M = 10
+# graph engine: number of track vertices tested per step of the walk, doubled up to
+# the maximum while the track stays on the same segments
+GRAPH_WALK_MIN_VERTICES = 16
+GRAPH_WALK_MAX_VERTICES = 1024
+
+# --- route clustering parameters ---
+# Match only one representative of each group of near-identical tracks (e.g. the same
+# commute ridden many times) and copy its matches to the other tracks of the group
+USE_ROUTE_CLUSTERS = True
+# grid cell size (m) of the start, end and length fingerprint grouping candidate tracks
+ROUTE_CLUSTER_CELL_M = 500
+# maximum distance (m) between a track and its representative, both ways: about the
+# spread of GPS tracks of the same route, half the narrowest buffer distance so the
+# copied matches stay close to the track's own at every buffer distance
+ROUTE_CLUSTER_TOLERANCE_M = min(BUFFER_DISTANCES_M) / 2
+# spacing (m) of the points sampled along the tracks to compare them
+ROUTE_CLUSTER_SAMPLE_M = 100
 
 # --- application parameters ---
 progress_state = {}
 
-# --- helper function at module level (picklable) ---
-def parse_single_gpx(gpx_file, zip_folder):
+# --- network state ---
+# lookups over the loaded bike network, built once and reused by every job
+_network_index = None
+
+# --- worker state ---
+# ZIP handle kept open per process so workers don't reopen the archive for every file
+_worker_zip = None
+_worker_zip_key = None
+# bike network segments of a pool worker (see `_init_worker`)
+_worker_network = None
+
+# --- pool state ---
+# long-lived process pool shared by parsing and matching jobs (see `get_worker_pool`)
+_pool = None
+_pool_workers = 0
+_pool_network = None
+
+def _get_zip_handle(zip_file_path):
+    """Return this process' ZipFile handle for `zip_file_path`, (re)opening it if needed."""
+    global _worker_zip, _worker_zip_key
+    # include mtime so a re-uploaded ZIP with the same name is not read from a stale handle
+    key = (zip_file_path, os.stat(zip_file_path).st_mtime_ns)
+    if _worker_zip_key != key:
+        if _worker_zip is not None:
+            _worker_zip.close()
+        _worker_zip = zipfile.ZipFile(zip_file_path, "r")
+        _worker_zip_key = key
+    return _worker_zip
+
+def list_gpx_members(zip_ref):
+    """
+    Return the names of the activity (GPX/TCX) members of an open ZIP archive,
+    in any (nested) folder, skipping macOS resource forks.
+    """
+    return [
+        name for name in zip_ref.namelist()
+        if name.lower().endswith(ACTIVITY_EXTENSIONS)
+        and not name.startswith("__MACOSX/")
+        and not os.path.basename(name).startswith("._")
+    ]
+
+def member_sizes(zip_ref, gpx_files):
+    """
+    Return the uncompressed sizes (bytes) of activity members of an open ZIP
+    archive. For gzipped members stored without compression this is the size
+    of the document inside, read from the ISIZE field of the gzip trailer
+    (the size modulo 2**32); seeking to the end of a deflated member would
+    inflate all of it, so those are estimated by the size of the gzip stream.
+    """
+    sizes = []
+    for gpx_file in gpx_files:
+        info = zip_ref.getinfo(gpx_file)
+        size = info.file_size
+        if gpx_file.lower().endswith(".gz") and size >= 18 and info.compress_type == zipfile.ZIP_STORED:
+            with zip_ref.open(info) as member:
+                member.seek(-4, os.SEEK_END)
+                size = int.from_bytes(member.read(4), "little")
+        sizes.append(size)
+    return sizes
+
+def _clear_element(elem):
+    """Free a parsed element and any already processed siblings preceding it."""
+    elem.clear(keep_tail=True)
+    parent = elem.getparent()
+    if parent is not None:
+        while elem.getprevious() is not None:
+            del parent[0]
+
+def _track_accepted(track_filter, activity_type=None, track_date=None):
+    """
+    Check a track against an ingest filter (see `make_track_filter`).
+
+    Values that are not known (yet) are not held against the track. Once a
+    track's type is final, pass it through `map_activity_type` so a missing
+    type is checked as "unknown".
+    """
+    if track_filter is None:
+        return True
+    activity_types, start_date, end_date = track_filter
+    if activity_type is not None and activity_types is not None \
+            and map_activity_type(activity_type) not in activity_types:
+        return False
+    if track_date is not None:
+        if start_date is not None and track_date < start_date:
+            return False
+        if end_date is not None and track_date > end_date:
+            return False
+    return True
+
+def make_track_filter(activity_types=None, start_date=None, end_date=None):
+    """
+    Build the (picklable) ingest filter passed to the parse workers.
+
+    Args:
+        activity_types (Iterable, optional): Activity categories to keep, as
+            returned by `map_activity_type` (e.g. "cycling", "unknown").
+        start_date (date, optional): Earliest track date to keep.
+        end_date (date, optional): Latest track date to keep.
+
+    Returns:
+        tuple | None: The filter, or None if nothing is filtered.
+    """
+    if activity_types is None and start_date is None and end_date is None:
+        return None
+    return (
+        frozenset(activity_types) if activity_types is not None else None,
+        start_date,
+        end_date
+    )
+
+def _select_tracks(batch, keep):
+    """Return a columnar track batch holding only the tracks flagged in `keep`."""
+    meta, coords, seg_offsets, track_offsets = batch
+    keep = np.asarray(keep, dtype=bool)
+    segs_per_track = np.diff(track_offsets)
+    pts_per_seg = np.diff(seg_offsets)
+    seg_keep = np.repeat(keep, segs_per_track)
+    return (
+        [row for row, k in zip(meta, keep) if k],
+        coords[np.repeat(seg_keep, pts_per_seg)],
+        np.concatenate([[0], np.cumsum(pts_per_seg[seg_keep])]).astype(np.int64),
+        np.concatenate([[0], np.cumsum(segs_per_track[keep])]).astype(np.int64)
+    )
+
+def _decimate_batch(batch, min_spacing_m):
+    """
+    Thin out the trackpoints of a columnar track batch to a minimum spacing.
+
+    Distances are measured along the track with a local equirectangular
+    approximation. Per segment, the next point kept is the first one at least
+    `min_spacing_m` further along than the last point kept; the first and
+    last point of every segment are always kept.
+    """
+    meta, coords, seg_offsets, track_offsets = batch
+    if min_spacing_m <= 0 or len(coords) < 3:
+        return batch
+
+    lon, lat = np.radians(coords[:, 0]), np.radians(coords[:, 1])
+    dx = np.diff(lon) * np.cos((lat[1:] + lat[:-1]) / 2)
+    dy = np.diff(lat)
+    step = np.empty(len(coords))
+    step[0] = 0
+    step[1:] = np.hypot(dx, dy) * EARTH_RADIUS_M
+    step[seg_offsets[:-1]] = 0  # no distance across segment boundaries
+    # distance travelled since the start of the batch, a plain list for fast bisection
+    travelled = np.cumsum(step).tolist()
+
+    keep = np.zeros(len(coords), dtype=bool)
+    for start, end in zip(seg_offsets[:-1].tolist(), seg_offsets[1:].tolist()):
+        i = start
+        while i < end:
+            keep[i] = True
+            i = bisect.bisect_left(travelled, travelled[i] + min_spacing_m, i + 1, end)
+    keep[seg_offsets[1:] - 1] = True
+
+    kept_before = np.concatenate([[0], np.cumsum(keep)])
+    return meta, coords[keep], kept_before[seg_offsets].astype(np.int64), track_offsets
+
+def _track_fingerprints(start_times, coords, seg_offsets, track_offsets):
+    """
+    Return the fingerprint of each track of a columnar track batch: a hash of
+    its start time, number of points and coordinates rounded to
+    FINGERPRINT_DECIMALS, identical for the same activity in different exports.
+    """
+    point_offsets = seg_offsets[track_offsets]
+    grid = np.round(coords * 10**FINGERPRINT_DECIMALS).astype(np.int64)
+    fingerprints = []
+    for start_time, first, last in zip(start_times, point_offsets[:-1], point_offsets[1:]):
+        h = hashlib.blake2b(digest_size=16)
+        h.update(f"{start_time.isoformat()}|{last - first}|".encode())
+        h.update(grid[first:last].tobytes())
+        fingerprints.append(h.hexdigest())
+    return fingerprints
+
+def _duplicate_tracks(fingerprints, track_uids):
     """
-    Parse a GPX file and return a list of dictionaries,
-    one per <trk> element (track) found.
+    Flag the tracks whose fingerprint was already seen, keeping the one with
+    the first `track_uid` of each fingerprint (independent of parse order).
+
+    Returns:
+        ndarray: Boolean mask of the duplicate tracks.
     """
-    gpx_path = os.path.join(zip_folder, gpx_file)
-    tree = etree.parse(gpx_path)
-    root = tree.getroot()
+    order = np.argsort(np.asarray(track_uids, dtype=object), kind="stable")
+    duplicate = np.zeros(len(order), dtype=bool)
+    duplicate[order] = pd.Series(fingerprints, dtype=object).iloc[order].duplicated().to_numpy()
+    return duplicate
 
-    ns = {"gpx": "http://www.topografix.com/GPX/1/1"}  # GPX namespace
+def _parse_gpx_stream(source, gpx_file, track_filter=None):
+    """
+    Incrementally parse a GPX document into a columnar track batch,
+    with one track per <trk> element found.
 
+    Elements are cleared as soon as they have been consumed, so memory usage
+    is bounded by the collected coordinates rather than by the XML tree.
+    Tracks rejected by `track_filter` are dropped as soon as their <type>
+    or first <time> shows it, without collecting any further points.
+
+    Returns:
+        tuple:
+            list: Track metadata tuples, ordered as TRACK_META_COLUMNS.
+            ndarray: (n_points, 2) float64 lon/lat coordinates of all tracks.
+            ndarray: Point offsets of each segment (n_segments + 1).
+            ndarray: Segment offsets of each track (n_tracks + 1).
+    """
     gpx_name = os.path.basename(gpx_file)
-    tracks_data = []
-
-    # Iterate over every <trk> in the GPX
-    for idx, trk in enumerate(root.findall(".//gpx:trk", namespaces=ns)):
-        # Track name
-        trk_name_elem = trk.find("gpx:name", namespaces=ns)
-        track_name = trk_name_elem.text if trk_name_elem is not None else None
-
-        # Create a unique-ish id: file + track index
-        track_uid = f"{gpx_name}__{idx}"
-
-        # Activity type (track-level first, fallback to root)
-        type_elem = trk.find("gpx:type", namespaces=ns)
-        if type_elem is None:
-            type_elem = root.find("gpx:type", namespaces=ns)
-        activity_type = type_elem.text if type_elem is not None else None
-
-        # Collect all segments
-        line_segments = []
-        track_date = None
-        for seg in trk.findall("gpx:trkseg", namespaces=ns):
-            pts = []
-            for p in seg.findall("gpx:trkpt", namespaces=ns):
-                lon, lat = float(p.attrib["lon"]), float(p.attrib["lat"])
-                pts.append((lon, lat))
+    meta = []
+    start_times = []      # first time of each kept track (see `_track_fingerprints`)
+    xy = []               # flat lon/lat values of the kept segments
+    seg_offsets = [0]     # point offset of each kept segment
+    track_offsets = [0]   # segment offset of each kept track
+    root_type = None
+    track = None
+    seg_start = None
+    trk_idx = 0
+
+    context = etree.iterparse(
+        source,
+        events=("start", "end"),
+        tag=(GPX_TRK, GPX_TRKSEG, GPX_TRKPT, GPX_NAME, GPX_TYPE)
+    )
+    for event, elem in context:
+        tag = elem.tag
+        if event == "start":
+            if tag == GPX_TRK:
+                track = {
+                    "name": None, "type": None, "date": None, "start": None, "rejected": False,
+                    "xy_start": len(xy), "seg_start": len(seg_offsets)
+                }
+            elif tag == GPX_TRKSEG:
+                seg_start = len(xy)
+                # <type> precedes the segments: reject on activity type right away
+                if track is not None and not _track_accepted(track_filter, track["type"]):
+                    track["rejected"] = True
+            continue
+
+        if tag == GPX_TRKPT:
+            if seg_start is not None and not track["rejected"]:
+                xy.append(float(elem.attrib["lon"]))
+                xy.append(float(elem.attrib["lat"]))
                 # first time element across all segments → track_date
-                if track_date is None:
-                    t_elem = p.find("gpx:time", namespaces=ns)
+                if track["date"] is None:
+                    t_elem = elem.find(GPX_TIME)
                     if t_elem is not None:
-                        track_date = pd.to_datetime(t_elem.text, utc=True).date()
-            if len(pts) > 1:
-                line_segments.append(LineString(pts))
-
-        if not line_segments or track_date is None:
-            continue  # skip empty/bad tracks
-
-        geom = MultiLineString(line_segments) if len(line_segments) > 1 else line_segments[0]
-
-        tracks_data.append({
-            "gpx_name": gpx_name,
-            "track_name": track_name,
-            "track_uid": track_uid,
-            "track_date": track_date,
-            "geometry": geom,
-            "activity_type": activity_type
-        })
+                        track["start"] = pd.to_datetime(t_elem.text, utc=True)
+                        track["date"] = track["start"].date()
+                        if not _track_accepted(track_filter, track["type"], track["date"]):
+                            # drop the points collected so far and ignore the rest
+                            track["rejected"] = True
+                            del xy[track["xy_start"]:]
+                            del seg_offsets[track["seg_start"]:]
+                            seg_start = len(xy)
+            _clear_element(elem)
+        elif tag == GPX_TRKSEG:
+            if track is not None and not track["rejected"] and len(xy) - seg_start > 2:
+                seg_offsets.append(len(xy) // 2)
+            else:
+                del xy[seg_start:]  # fewer than 2 points: not a line
+            seg_start = None
+            _clear_element(elem)
+        elif tag == GPX_NAME:
+            # only the track name is relevant (not metadata or waypoint names)
+            if track is not None and elem.getparent().tag == GPX_TRK:
+                track["name"] = elem.text
+        elif tag == GPX_TYPE:
+            # track type, or the document-wide fallback directly under <gpx>
+            # (not the type of a waypoint or route)
+            parent_tag = elem.getparent().tag
+            if track is not None and parent_tag == GPX_TRK:
+                track["type"] = elem.text
+            elif parent_tag == GPX_ROOT:
+                root_type = elem.text
+        elif tag == GPX_TRK:
+            if len(seg_offsets) > track["seg_start"] and track["date"] is not None \
+                    and not track["rejected"] \
+                    and _track_accepted(track_filter, track["type"] or root_type, track["date"]):
+                track_offsets.append(len(seg_offsets) - 1)
+                meta.append([
+                    gpx_name,
+                    track["name"],
+                    # Create a unique-ish id: file (path in the ZIP) + track index
+                    f"{gpx_file}__{trk_idx}",
+                    track["date"],
+                    None,  # fingerprint, once the coordinates are collected
+                    track["type"]
+                ])
+                start_times.append(track["start"])
+            else:
+                # skip empty/bad tracks
+                del xy[track["xy_start"]:]
+                del seg_offsets[track["seg_start"]:]
+            trk_idx += 1
+            track = None
+            _clear_element(elem)
+    del context
+
+    # Activity type: track-level first, fallback to root
+    if root_type is not None:
+        for row in meta:
+            if row[-1] is None:
+                row[-1] = root_type
+
+    coords = np.asarray(xy, dtype=np.float64).reshape(-1, 2)
+    seg_offsets = np.asarray(seg_offsets, dtype=np.int64)
+    track_offsets = np.asarray(track_offsets, dtype=np.int64)
+    for row, fingerprint in zip(
+        meta, _track_fingerprints(start_times, coords, seg_offsets, track_offsets)
+    ):
+        row[-2] = fingerprint
+
+    batch = ([tuple(row) for row in meta], coords, seg_offsets, track_offsets)
+    if track_filter is not None:
+        # the root-level type only becomes known at the end of the document,
+        # tracks still without a type are checked as "unknown"
+        batch = _select_tracks(batch, [
+            _track_accepted(track_filter, map_activity_type(row[-1])) for row in batch[0]
+        ])
+    return batch
+
+def _parse_tcx_stream(source, gpx_file, track_filter=None):
+    """
+    Incrementally parse a Garmin TCX document into a columnar track batch.
+
+    The result is the same as parsing the GPX written by `tcx_to_gpx`: a
+    single track named after the file, holding all trackpoints with a
+    position, with the Sport of the first Activity as (mapped) activity type.
+    See `_parse_gpx_stream` for the batch layout. Parsing stops as soon as
+    the Sport or the first time shows that `track_filter` rejects the track.
+    """
+    xy = []
+    sport = None
+    start_time = None
+    rejected = False
+
+    context = etree.iterparse(
+        source, events=("start", "end"), tag=(TCX_ACTIVITY, TCX_TRACKPOINT)
+    )
+    for event, elem in context:
+        if elem.tag == TCX_ACTIVITY:
+            if event == "start" and sport is None:
+                sport = elem.get("Sport", "unknown")
+                if not _track_accepted(track_filter, sport):
+                    rejected = True
+                    break
+            elif event == "end":
+                _clear_element(elem)
+            continue
+        if event == "start":
+            continue
+
+        pos = elem.find(TCX_POSITION)
+        if pos is not None:
+            lat = pos.find(TCX_LAT)
+            lon = pos.find(TCX_LON)
+            if lat is not None and lon is not None:
+                xy.append(float(lon.text))
+                xy.append(float(lat.text))
+                # first time element of a positioned trackpoint → track_date
+                if start_time is None:
+                    t_elem = elem.find(TCX_TIME)
+                    if t_elem is not None:
+                        start_time = pd.to_datetime(t_elem.text, utc=True)
+                        if not _track_accepted(track_filter, sport, start_time.date()):
+                            rejected = True
+                            break
+        _clear_element(elem)
+    del context
+
+    coords = np.asarray(xy, dtype=np.float64).reshape(-1, 2)
+    if rejected or len(coords) < 2 or start_time is None:
+        # skip empty/bad tracks
+        return (
+            [], coords[:0], np.zeros(1, dtype=np.int64), np.zeros(1, dtype=np.int64)
+        )
+    gpx_name = os.path.basename(gpx_file)
+    seg_offsets = np.asarray([0, len(coords)], dtype=np.int64)
+    track_offsets = np.asarray([0, 1], dtype=np.int64)
+    fingerprint, = _track_fingerprints([start_time], coords, seg_offsets, track_offsets)
+    meta = [(
+        gpx_name, gpx_name, f"{gpx_file}__0", start_time.date(), fingerprint,
+        map_activity_type(sport or "unknown")
+    )]
+    return meta, coords, seg_offsets, track_offsets
+
+def _batch_geometries(coords, seg_offsets, track_offsets):
+    """
+    Build one (Multi)LineString per track from columnar coordinates in a
+    couple of vectorized shapely calls.
+    """
+    n_segments = len(seg_offsets) - 1
+    seg_index = np.repeat(np.arange(n_segments), np.diff(seg_offsets))
+    lines = shapely.linestrings(coords, indices=seg_index)
+
+    segs_per_track = np.diff(track_offsets)
+    geoms = lines[track_offsets[:-1]]
+    is_multi = segs_per_track > 1
+    if is_multi.any():
+        seg_multi = np.repeat(is_multi, segs_per_track)
+        # renumber multi-segment tracks 0..k-1 as required by `indices`
+        multi_index = np.repeat(np.cumsum(is_multi)[is_multi] - 1, segs_per_track[is_multi])
+        geoms[is_multi] = shapely.multilinestrings(lines[seg_multi], indices=multi_index)
+    return geoms
+
+def tracks_to_geodataframe(batches, crs="EPSG:4326"):
+    """
+    Concatenate columnar track batches (as returned by `parse_gpx_member`)
+    and build the track GeoDataFrame in one go.
+
+    Args:
+        batches (list): Columnar track batches.
+        crs (str): CRS of the batch coordinates.
+
+    Returns:
+        GeoDataFrame: One row per track, with TRACK_COLUMNS as columns.
+    """
+    meta = [row for batch in batches for row in batch[0]]
+    coords = np.concatenate([batch[1] for batch in batches])
+
+    # shift per-batch offsets so they index into the concatenated arrays
+    seg_parts, track_parts = [np.zeros(1, dtype=np.int64)], [np.zeros(1, dtype=np.int64)]
+    point_base = seg_base = 0
+    for _, batch_coords, seg_offsets, track_offsets in batches:
+        seg_parts.append(seg_offsets[1:] + point_base)
+        track_parts.append(track_offsets[1:] + seg_base)
+        point_base += len(batch_coords)
+        seg_base += len(seg_offsets) - 1
+
+    geoms = _batch_geometries(coords, np.concatenate(seg_parts), np.concatenate(track_parts))
+    return _tracks_frame(meta, geoms, crs)
+
+def _tracks_frame(meta, geoms, crs):
+    """Assemble the track GeoDataFrame from metadata tuples and track geometries."""
+    gdf = gpd.GeoDataFrame(
+        pd.DataFrame(meta, columns=TRACK_META_COLUMNS), geometry=geoms, crs=crs
+    )
+    return gdf[TRACK_COLUMNS]
+
+def _share_coords(coords):
+    """
+    Copy coordinates into a new shared memory block and return its name.
+
+    Ownership of the block passes to the reading process, which unlinks it
+    (see `_read_shared_batch`).
+    """
+    shm = shared_memory.SharedMemory(create=True, size=max(coords.nbytes, 1))
+    view = np.ndarray(coords.shape, dtype=coords.dtype, buffer=shm.buf)
+    view[:] = coords
+    del view  # release the buffer export before closing
+    # don't let this process' resource tracker unlink the block when the worker exits
+    resource_tracker.unregister(shm._name, "shared_memory")
+    shm.close()
+    return shm.name
+
+def _read_shared_batch(batch):
+    """
+    Copy the coordinates of a batch out of its shared memory block and
+    release the block right away, so blocks never pile up in /dev/shm.
+
+    Returns:
+        tuple: Columnar track batch holding its own coordinates.
+    """
+    meta, (shm_name, n_points), seg_offsets, track_offsets = batch
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        view = np.ndarray((n_points, 2), dtype=np.float64, buffer=shm.buf)
+        coords = view.copy()
+        del view  # release the buffer export before closing
+    finally:
+        shm.close()
+        shm.unlink()
+    return meta, coords, seg_offsets, track_offsets
+
+def _release_shared_batches(batches):
+    """
+    Free the shared memory blocks of parsed batches that won't be read (see
+    `parse_gpx_chunk`), e.g. after another task of the same job failed.
+    """
+    for batch in batches:
+        if batch is None or not isinstance(batch[1], tuple):
+            continue
+        try:
+            shm = shared_memory.SharedMemory(name=batch[1][0])
+        except FileNotFoundError:
+            continue
+        shm.close()
+        shm.unlink()
+
+# --- helper functions at module level (picklable) ---
+def parse_gpx_member(gpx_file, zip_source, shared=False, use_cache=False, track_filter=None):
+    """
+    Parse a GPX or TCX member of a ZIP archive into a columnar track batch,
+    together with the content hash of the member.
+
+    The member is streamed straight out of the archive, nothing is extracted
+    to disk, and hashed in the same pass as it is parsed. With
+    ``use_cache=True`` the batch of a member whose tracks are already in the
+    track cache is dropped right after parsing.
+
+    Args:
+        gpx_file (str): Name of the GPX or TCX member inside the ZIP.
+        zip_source (ZipFile | str): Open ZIP archive, or the path to it
+            (parallel workers keep their own handle per process).
+        shared (bool): Return the batch coordinates as a shared memory
+            ``(name, n_points)`` handle (see `_read_shared_batch`).
+        use_cache (bool): Return no batch for members found in the track cache.
+        track_filter (tuple, optional): Ingest filter on activity type and
+            date (see `make_track_filter`), applied while streaming.
+
+    Returns:
+        tuple:
+            str: Content hash of the member.
+            tuple | None: Columnar track batch (see `tracks_to_geodataframe`),
+                or None if the tracks can be loaded from the cache.
+    """
+    zip_ref = _get_zip_handle(zip_source) if isinstance(zip_source, str) else zip_source
+    is_gzip = gpx_file.lower().endswith(".gz")
+    parse = _parse_tcx_stream if gpx_file.lower().endswith((".tcx", ".tcx.gz")) else _parse_gpx_stream
+    with zip_ref.open(gpx_file) as member:
+        # the content hash is computed on the decompressed document, while parsing it
+        reader = HashingReader(gzip.GzipFile(fileobj=member) if is_gzip else member)
+        batch = parse(reader, gpx_file, track_filter)
+        # parsing may stop early on a rejected track; hash the whole member regardless
+        while reader.read(1024**2):
+            pass
+        digest = reader.hexdigest()
+    if use_cache and has_cached_tracks(digest):
+        return digest, None
+
+    batch = _decimate_batch(batch, DECIMATE_MIN_SPACING_M)
+    if shared and batch[0]:
+        meta, coords, seg_offsets, track_offsets = batch
+        batch = meta, (_share_coords(coords), len(coords)), seg_offsets, track_offsets
+    return digest, batch
 
-    return tracks_data if tracks_data else None
+def split_lines(geometries, max_length):
+    """
+    Cut (Multi)LineStrings into pieces of about `max_length` along the line.
+
+    Length is measured along all parts of a geometry in turn, so short parts
+    end up together in one MultiLineString piece. Pieces start and end at
+    existing vertices and consecutive pieces of a part share their boundary
+    vertex, so the union of the pieces of a geometry is the geometry itself;
+    an edge longer than `max_length` ends up in one piece.
+
+    Args:
+        geometries (array-like): Projected line geometries.
+        max_length (float): Target piece length in CRS units.
+
+    Returns:
+        tuple:
+            np.ndarray: (Multi)LineString pieces.
+            np.ndarray: Position of the source geometry of each piece.
+    """
+    parts, part_source = shapely.get_parts(np.asarray(geometries), return_index=True)
+    coords, point_part = shapely.get_coordinates(parts, return_index=True)
+    if len(coords) == 0:
+        return np.empty(0, dtype=object), np.empty(0, dtype=np.int64)
+
+    # distance travelled since the start of the geometry (along its parts), per vertex
+    part_first = np.empty(len(coords), dtype=bool)
+    part_first[0] = True
+    part_first[1:] = point_part[1:] != point_part[:-1]
+    step = np.empty(len(coords))
+    step[0] = 0
+    step[1:] = np.hypot(*np.diff(coords, axis=0).T)
+    step[part_first] = 0
+    travelled = np.cumsum(step)
+    part_rank = np.cumsum(part_first) - 1
+    point_source = part_source[point_part]
+    source_first = np.empty(len(coords), dtype=bool)
+    source_first[0] = True
+    source_first[1:] = point_source[1:] != point_source[:-1]
+    travelled -= travelled[source_first][np.cumsum(source_first) - 1]
+    piece = (travelled // max_length).astype(np.int64)
+
+    # repeat the first vertex of each piece as last vertex of the previous one
+    boundary = np.flatnonzero(~part_first & (piece != np.roll(piece, 1)))
+    vertex = np.concatenate([np.arange(len(coords)), boundary])
+    vertex_piece = np.concatenate([piece, piece[boundary - 1]])
+    vertex_part = part_rank[vertex]
+    order = np.lexsort((vertex, vertex_piece, vertex_part))
+    vertex, vertex_piece, vertex_part = vertex[order], vertex_piece[order], vertex_part[order]
+
+    new_piece = np.empty(len(vertex), dtype=bool)
+    new_piece[0] = True
+    new_piece[1:] = (vertex_piece[1:] != vertex_piece[:-1]) | (vertex_part[1:] != vertex_part[:-1])
+    piece_id = np.cumsum(new_piece) - 1
+
+    # a trailing piece holding just one vertex is already covered by the previous piece
+    valid = np.bincount(piece_id) >= 2
+    keep = valid[piece_id]
+    lines = shapely.linestrings(
+        coords[vertex[keep]], indices=np.cumsum(valid)[piece_id[keep]] - 1
+    )
+    line_source = part_source[vertex_part[new_piece][valid]]
+    line_piece = vertex_piece[new_piece][valid]
+
+    # lines of the same geometry and piece (in consecutive parts) form one piece
+    new_group = np.empty(len(lines), dtype=bool)
+    new_group[0] = True
+    new_group[1:] = (line_source[1:] != line_source[:-1]) | (line_piece[1:] != line_piece[:-1])
+    group = np.cumsum(new_group) - 1
+    lines_per_group = np.bincount(group)
+    pieces = lines[new_group]
+    is_multi = lines_per_group > 1
+    if is_multi.any():
+        line_multi = is_multi[group]
+        pieces[is_multi] = shapely.multilinestrings(
+            lines[line_multi], indices=np.cumsum(is_multi)[group[line_multi]] - 1
+        )
+    return pieces, line_source[new_group]
+
+def load_segment_corridors(bike_network):
+    """
+    Return the corridor polygon (buffer of BUFFER_DISTANCE_M) of each segment.
+
+    The corridors precomputed by scripts/geofabrik_processing.py are used when
+    they belong to this network and buffer distance; otherwise the segments
+    are buffered here.
+
+    Args:
+        bike_network (GeoDataFrame): GeoDataFrame of bike network segments.
+
+    Returns:
+        np.ndarray: Corridor polygons, in the row order of `bike_network`.
+    """
+    if os.path.exists(CORRIDOR_PROJECTED_PARQUET_PATH):
+        corridors = gpd.read_parquet(CORRIDOR_PROJECTED_PARQUET_PATH)
+        if (
+            len(corridors) == len(bike_network)
+            and (corridors["osm_id"].values == bike_network["osm_id"].values).all()
+            and (corridors["buffer_distance_m"] == BUFFER_DISTANCE_M).all()
+        ):
+            return corridors.geometry.values
+    return shapely.simplify(
+        shapely.buffer(bike_network.geometry.values, BUFFER_DISTANCE_M), CORRIDOR_SIMPLIFY_M
+    )
+
+def load_network_mask(bike_network):
+    """
+    Return the grid mask of the network extent (see `build_network_mask`).
+
+    The mask stored by scripts/geofabrik_processing.py is used when it was
+    built for this network and buffer distances; otherwise it is built here.
+
+    Args:
+        bike_network (GeoDataFrame): GeoDataFrame of bike network segments.
+
+    Returns:
+        Polygon | MultiPolygon: The network mask.
+    """
+    if os.path.exists(NETWORK_MASK_PARQUET_PATH):
+        mask = gpd.read_parquet(NETWORK_MASK_PARQUET_PATH)
+        if (
+            len(mask) == 1
+            and mask["n_segments"].iloc[0] == len(bike_network)
+            and mask["cell_size_m"].iloc[0] == NETWORK_MASK_CELL_M
+            and mask["buffer_distance_m"].iloc[0] >= max(BUFFER_DISTANCES_M)
+        ):
+            return mask.geometry.iloc[0]
+    return build_network_mask(bike_network.geometry)
+
+def load_network_graph(bike_network):
+    """
+    Return the node-segment adjacency of the network graph (see `build_network_graph`).
+
+    The adjacency stored by scripts/geofabrik_processing.py is used when it
+    was built for these segments; otherwise it is built here.
+
+    Args:
+        bike_network (GeoDataFrame): GeoDataFrame of bike network segments.
+
+    Returns:
+        DataFrame: `node_id` and `osm_id` columns, sorted by `node_id`.
+    """
+    if os.path.exists(NETWORK_GRAPH_PARQUET_PATH):
+        edges = pd.read_parquet(NETWORK_GRAPH_PARQUET_PATH)
+        ends = bike_network[["osm_id_from", "osm_id_to"]]
+        n_edges = ends.notna().values.sum() - (ends["osm_id_from"] == ends["osm_id_to"]).sum()
+        if len(edges) == n_edges and edges["osm_id"].isin(bike_network["osm_id"]).all():
+            return edges
+    return build_network_graph(bike_network)
+
+class NetworkIndex:
+    """
+    Long-lived lookups over the bike network: a spatial index of the segments
+    and positional lookups from OSM id to row, for segments and nodes.
+
+    Built once when the network is loaded (see `get_network_index`), so that
+    processing jobs and callbacks don't derive them again every time.
+
+    Attributes:
+        segments (GeoDataFrame): Bike network segments.
+        nodes (GeoDataFrame | None): Bike nodes.
+        tree (STRtree): Spatial index over the segment geometries.
+    """
+
+    def __init__(self, segments, nodes=None):
+        self.segments = segments
+        self.nodes = nodes
+        self.tree = shapely.STRtree(segments.geometry.values)
+        # segments without overlapping or crossing parts: their length is the
+        # length of their linework, so a buffer covering them overlaps all of it
+        self.simple_segments = shapely.is_simple(segments.geometry.values)
+        self._segment_pos = pd.Index(segments["osm_id"])
+        self._node_pos = pd.Index(nodes["osm_id"]) if nodes is not None else None
+        self._corridors = None
+        self._mask = None
+        self._graph = None
+        self._graph_nodes = None
+
+    def segment_positions(self, osm_ids):
+        """Return the row position of each segment osm_id, -1 if unknown."""
+        return self._segment_pos.get_indexer(pd.Index(osm_ids))
+
+    def node_positions(self, osm_ids):
+        """Return the row position of each node osm_id, -1 if unknown."""
+        return self._node_pos.get_indexer(pd.Index(osm_ids))
+
+    def segments_at_nodes(self, node_ids):
+        """Return the row positions of the segments starting or ending in any of `node_ids`."""
+        indptr, adjacency, _ = self.graph()
+        nodes = self._graph_nodes.get_indexer(pd.Index(list(set(node_ids))))
+        nodes = nodes[nodes >= 0]
+        if not len(nodes):
+            return np.empty(0, dtype=np.int64)
+        counts = indptr[nodes + 1] - indptr[nodes]
+        offsets = np.repeat(indptr[nodes] - (np.cumsum(counts) - counts), counts)
+        return np.unique(adjacency[offsets + np.arange(counts.sum())])
+
+    def corridors(self):
+        """Return the segment corridors (see `load_segment_corridors`) and their STRtree."""
+        if self._corridors is None:
+            corridors = load_segment_corridors(self.segments)
+            shapely.prepare(corridors)
+            self._corridors = (corridors, shapely.STRtree(corridors))
+        return self._corridors
+
+    def graph(self):
+        """
+        Return the CSR adjacency of the network graph (see `load_network_graph`)
+        as `(indptr, adjacency, segment_nodes)`: the rows of the segments ending
+        in node i are `adjacency[indptr[i]:indptr[i + 1]]`, and `segment_nodes`
+        holds the node index of the start and end of each segment (-1 if unknown).
+        """
+        if self._graph is None:
+            edges = load_network_graph(self.segments)
+            node_ids, start = np.unique(edges["node_id"].values, return_index=True)
+            indptr = np.append(start, len(edges))
+            adjacency = self.segment_positions(edges["osm_id"])
+            ends = self.segments[["osm_id_from", "osm_id_to"]].values.ravel()
+            self._graph_nodes = pd.Index(node_ids)
+            segment_nodes = self._graph_nodes.get_indexer(ends).reshape(-1, 2)
+            self._graph = (indptr, adjacency, segment_nodes)
+        return self._graph
+
+    def mask(self):
+        """Return the (prepared) grid mask of the network extent, see `load_network_mask`."""
+        if self._mask is None:
+            self._mask = load_network_mask(self.segments)
+            shapely.prepare(self._mask)
+        return self._mask
+
+def get_network_index(bike_network, point_geodf=None):
+    """
+    Return the `NetworkIndex` of `bike_network` (and `point_geodf`), building
+    it only when called with other network data than the previous time.
+    """
+    global _network_index
+    if _network_index is None or _network_index.segments is not bike_network \
+            or (point_geodf is not None and _network_index.nodes is not point_geodf):
+        _network_index = NetworkIndex(bike_network, point_geodf)
+    return _network_index
+
+def clip_to_network(gpx_gdf, network):
+    """
+    Drop the tracks outside the network extent and clip the tracks partly
+    outside it to the network mask, before matching.
+
+    The mask is dilated by at least the buffer distance, so clipping doesn't
+    change which segments match; only the geometries handed to the matcher
+    are clipped, not the tracks returned to the user.
+
+    Args:
+        gpx_gdf (GeoDataFrame): Projected tracks.
+        network (NetworkIndex): Index of the bike network.
+
+    Returns:
+        GeoDataFrame: The tracks (partly) inside the network extent.
+    """
+    if gpx_gdf.empty:
+        return gpx_gdf
+    mask = network.mask()
+    geoms = gpx_gdf.geometry.values
+    inside = shapely.intersects(mask, geoms)
+    gpx_gdf, geoms = gpx_gdf[inside], geoms[inside]
+    partial = ~shapely.contains(mask, geoms)
+    if partial.any():
+        clipped = shapely.intersection(geoms[partial], mask)
+        # keep the lineal parts of the odd collection with points at the mask border
+        collections = shapely.get_type_id(clipped) == 7
+        for i in np.flatnonzero(collections):
+            parts = shapely.get_parts(clipped[i])
+            clipped[i] = shapely.multilinestrings(parts[shapely.get_type_id(parts) == 1])
+        geoms = geoms.copy()
+        geoms[partial] = clipped
+        gpx_gdf = gpx_gdf.set_geometry(gpd.GeoSeries(geoms, index=gpx_gdf.index, crs=gpx_gdf.crs))
+    return gpx_gdf
+
+def _empty_matches(bike_network):
+    """Return an empty matched segments GeoDataFrame (see `match_tracks`)."""
+    track_cols = MATCH_TRACK_COLUMNS + ["track_key"]
+    return gpd.GeoDataFrame(
+        bike_network.iloc[:0].assign(
+            **{c: None for c in track_cols}, intersection_length=0.0, overlap_percentage=0.0,
+            **{c: 0.0 for c in OVERLAP_COLUMNS.values()},
+            track_position_from=0.0, track_position_to=0.0
+        ),
+        crs=bike_network.crs
+    )
+
+def _matched_pairs(gpx_gdf, bike_network, pair_seg, pair_track,
+                   intersection_length, overlaps, min_overlap, positions=None):
+    """
+    Build the matched segments of (segment, track) pairs given by position,
+    keeping the pairs whose overlap at any buffer distance reaches
+    `min_overlap`. `overlaps` maps buffer distances to overlap fractions,
+    the distances of BUFFER_DISTANCES_M missing from it are left NaN, as are
+    the track positions of the end nodes when `positions` is not given.
+    """
+    if positions is None:
+        positions = (np.full(len(pair_seg), np.nan),) * 2
+    mask = np.max(list(overlaps.values()), axis=0) >= min_overlap
+    if not mask.any():
+        return _empty_matches(bike_network)
+    matched = bike_network.iloc[pair_seg[mask]].reset_index(drop=True)
+    track_info = gpx_gdf[MATCH_TRACK_COLUMNS + ["track_key"]].iloc[pair_track[mask]].reset_index(drop=True)
+    return gpd.GeoDataFrame(
+        pd.concat([matched, track_info], axis=1).assign(
+            intersection_length=intersection_length[mask],
+            overlap_percentage=overlaps[BUFFER_DISTANCE_M][mask],
+            **{
+                col: overlaps[d][mask] if d in overlaps else np.nan
+                for d, col in OVERLAP_COLUMNS.items()
+            },
+            track_position_from=positions[0][mask],
+            track_position_to=positions[1][mask]
+        ),
+        geometry=matched.geometry.name, crs=bike_network.crs
+    )
+
+def _overlap_fraction(intersection_length, segment_length):
+    """Return the overlap fraction of segments, 0 for segments without length."""
+    overlap = np.zeros(len(segment_length))
+    mask = segment_length > 0
+    overlap[mask] = np.clip(intersection_length[mask] / segment_length[mask], 0, 1)
+    return overlap
+
+def _overlap_lengths(pair_segs, simple, piece_buffers, piece_idx, first, counts):
+    """
+    Return the length of each pair segment inside the union of its piece
+    buffers `piece_buffers[piece_idx[first:first + counts]]` (see `match_tracks`).
+    """
+    # buffers are prepared once (not per pair); simple segments fully covered
+    # by their first buffer need no intersection at all
+    pair_buffers = piece_buffers[piece_idx[first]]
+    intersection_length = shapely.length(pair_segs)
+    partial = ~(simple & shapely.covers(pair_buffers, pair_segs))
+    intersection_length[partial] = shapely.length(
+        shapely.intersection(pair_segs[partial], pair_buffers[partial])
+    )
+
+    # for a segment hit by several pieces of a track, each next piece buffer only
+    # adds the part of the segment outside the previous ones (merging the
+    # overlapping intersection lines is not robust, and unioning the buffers is slow)
+    multi = np.flatnonzero(partial & (counts > 1))
+    remaining = shapely.difference(pair_segs[multi], pair_buffers[multi])
+    for k in range(1, counts.max(initial=1)):
+        sel = counts[multi] > k
+        rows, buffers = multi[sel], piece_buffers[piece_idx[first[multi[sel]] + k]]
+        intersection_length[rows] += shapely.length(shapely.intersection(remaining[sel], buffers))
+        remaining[sel] = shapely.difference(remaining[sel], buffers)
+    return np.nan_to_num(intersection_length)
+
+def _sampled_overlaps(pair_segs, pair_track, tracks, distances):
+    """
+    Return the overlap fraction of each pair segment with the buffers of its
+    track `tracks[pair_track]` at each of `distances`, as a dict.
+
+    The segments are densified to OVERLAP_SAMPLE_M and the distance of every
+    vertex to the track is computed once; a piece of segment between two
+    vertices counts as covered at a distance in proportion to how far the
+    distance crosses it, so all distances come from the same pass.
+    """
+    widest = max(distances)
+    parts, part_pair = shapely.get_parts(shapely.segmentize(pair_segs, OVERLAP_SAMPLE_M), return_index=True)
+    coords, coord_part = shapely.get_coordinates(parts, return_index=True)
+    coord_pair = part_pair[coord_part]
+
+    # track edges, each track shifted along x by its own stride so that a single
+    # spatial index query only pairs vertices with the edges of their own track
+    track_parts, track_part = shapely.get_parts(tracks, return_index=True)
+    track_coords, track_coord_part = shapely.get_coordinates(track_parts, return_index=True)
+    edge = track_coord_part[1:] == track_coord_part[:-1]
+    start, end = track_coords[:-1][edge], track_coords[1:][edge]
+    stride = np.ptp(np.concatenate([coords[:, 0], track_coords[:, 0]])) + 2 * widest + 1
+    edge_shift = track_part[track_coord_part[:-1][edge]] * stride
+    low, high = np.minimum(start, end), np.maximum(start, end)
+    tree = shapely.STRtree(shapely.box(low[:, 0] + edge_shift, low[:, 1], high[:, 0] + edge_shift, high[:, 1]))
+
+    # the vertices are looked up in runs of consecutive vertices of a part, one
+    # query box per run, and paired with every edge near their run
+    position = np.arange(len(coords)) - np.searchsorted(coord_part, coord_part)
+    run_start = np.flatnonzero(position % OVERLAP_SAMPLE_RUN == 0)
+    run_shift = pair_track[coord_pair[run_start]] * stride
+    run_low = np.minimum.reduceat(coords, run_start) - widest
+    run_high = np.maximum.reduceat(coords, run_start) + widest
+    run_idx, edge_idx = tree.query(shapely.box(
+        run_low[:, 0] + run_shift, run_low[:, 1], run_high[:, 0] + run_shift, run_high[:, 1]
+    ))
+    run_size = np.diff(np.append(run_start, len(coords)))[run_idx]
+    run_offset = np.cumsum(run_size) - run_size
+    coord_idx = np.repeat(run_start[run_idx] - run_offset, run_size) + np.arange(run_size.sum())
+    edge_idx = np.repeat(edge_idx, run_size)
+
+    # distance of each vertex to its nearest track edge, capped beyond the widest
+    # distance (a vertex without edge in reach is just outside every buffer)
+    to_point = coords[coord_idx] - start[edge_idx]
+    direction = end[edge_idx] - start[edge_idx]
+    along = np.clip(
+        np.einsum("ij,ij->i", to_point, direction) / np.maximum(np.einsum("ij,ij->i", direction, direction), 1e-12),
+        0, 1
+    )
+    distance = np.full(len(coords), widest + OVERLAP_SAMPLE_M)
+    np.minimum.at(distance, coord_idx, np.hypot(*(to_point - along[:, None] * direction).T))
+
+    # covered length of the pieces between consecutive vertices of a part
+    piece = coord_part[1:] == coord_part[:-1]
+    near, far = np.minimum(distance[:-1], distance[1:])[piece], np.maximum(distance[:-1], distance[1:])[piece]
+    piece_length = np.hypot(*(coords[1:] - coords[:-1])[piece].T)
+    piece_pair = coord_pair[1:][piece]
+    segment_length = shapely.length(pair_segs)
+    overlaps = {}
+    for d in distances:
+        covered = np.where(far <= d, 1.0, np.clip((d - near) / np.maximum(far - near, 1e-9), 0, 1))
+        lengths = np.bincount(piece_pair, weights=piece_length * covered, minlength=len(pair_segs))
+        overlaps[d] = _overlap_fraction(lengths, segment_length)
+    return overlaps
+
+def match_tracks(gpx_gdf, bike_network, min_overlap=INTERSECT_THRESHOLD):
+    """
+    Match projected GPX tracks with the bike network segments.
+
+    Cuts the tracks into pieces of TRACK_PIECE_LENGTH_M, buffers the pieces,
+    finds all segments intersecting a piece buffer with the spatial index,
+    and keeps the segments whose overlap with the buffer of the whole track
+    reaches `min_overlap`. Overlaps of the pieces of a track with the
+    same segment are merged, so nothing is counted twice.
+
+    The tracks are only buffered at the widest of BUFFER_DISTANCES_M, which
+    selects the pairs (a narrower buffer never overlaps more). The overlap of
+    the selected pairs at every distance is then sampled along the segments
+    in one pass (see `_sampled_overlaps`), so the reported overlaps are
+    consistent between distances.
+
+    Args:
+        gpx_gdf (GeoDataFrame): Simplified tracks in EPSG:3812, with
+            MATCH_TRACK_COLUMNS and a `track_key` column.
+        bike_network (GeoDataFrame): GeoDataFrame of bike network segments.
+        min_overlap (float): Minimum overlap fraction of a matched segment.
+
+    Returns:
+        GeoDataFrame: One row per matched (segment, track) pair with the
+            segment attributes, MATCH_TRACK_COLUMNS, `track_key`,
+            `intersection_length` (m) and `overlap_percentage` at
+            BUFFER_DISTANCE_M, and the overlap at each distance in OVERLAP_COLUMNS.
+    """
+    empty = _empty_matches(bike_network)
+    if gpx_gdf.empty:
+        return empty
+
+    # --- buffer GPX geometries, piece by piece, at the widest distance ---
+    progress_state["current-task"] = "Buffering GPX geometries"
+    progress_state["pct"] = 60
+    pieces, piece_track = split_lines(gpx_gdf.geometry.values, TRACK_PIECE_LENGTH_M)
+    piece_buffers = shapely.buffer(pieces, max(BUFFER_DISTANCES_M))
+
+    # --- spatial index: find all segments that intersect each piece buffer ---
+    progress_state["current-task"] = "Matching all GPX tracks with bike network"
+    progress_state["pct"] = 65
+    network = get_network_index(bike_network)
+    piece_idx, seg_idx = network.tree.query(piece_buffers, predicate="intersects")
+    if len(piece_idx) == 0:
+        return empty
+
+    # --- intersection lengths: compute segment overlap with each GPX track buffer ---
+    progress_state["current-task"] = "Calculating intersection lengths"
+    progress_state["pct"] = 75
+    seg_geoms = bike_network.geometry.values
+
+    # one (segment, track) pair per group of pieces, with the pieces of a pair
+    # at positions first:first + counts of the sorted `piece_idx`
+    pair = seg_idx.astype(np.int64) * len(gpx_gdf) + piece_track[piece_idx]
+    order = np.argsort(pair, kind="stable")
+    pair, piece_idx = pair[order], piece_idx[order]
+    pairs, first, counts = np.unique(pair, return_index=True, return_counts=True)
+    pair_seg, pair_track = np.divmod(pairs, len(gpx_gdf))
+
+    pair_segs = seg_geoms[pair_seg]
+    segment_length = shapely.length(pair_segs)
+    shapely.prepare(piece_buffers)
+    widest = _overlap_fraction(
+        _overlap_lengths(pair_segs, network.simple_segments[pair_seg], piece_buffers, piece_idx, first, counts),
+        segment_length
+    )
+
+    # --- overlap at every distance, sampled for the pairs kept at the widest ---
+    kept = np.flatnonzero(widest >= min_overlap)
+    overlaps = {d: np.zeros(len(pairs)) for d in BUFFER_DISTANCES_M}
+    if len(kept):
+        sampled = _sampled_overlaps(pair_segs[kept], pair_track[kept], gpx_gdf.geometry.values, BUFFER_DISTANCES_M)
+        for d in BUFFER_DISTANCES_M:
+            overlaps[d][kept] = sampled[d]
+
+    # --- filter segments by minimum overlap and add the track columns ---
+    return _matched_pairs(
+        gpx_gdf, bike_network, pair_seg, pair_track,
+        overlaps[BUFFER_DISTANCE_M] * segment_length, overlaps, min_overlap
+    )
+
+def match_tracks_corridor(gpx_gdf, bike_network, min_overlap=INTERSECT_THRESHOLD):
+    """
+    Match projected GPX tracks with the bike network segments, without
+    buffering the tracks.
+
+    The tracks are densified to CORRIDOR_DENSIFY_M and their vertices are
+    tested against the segment corridors (see `load_segment_corridors`) in
+    one bulk spatial index query. The overlap of a segment is estimated as the
+    fraction of its CORRIDOR_BIN_M bins onto which a vertex of the track
+    projects, and compared against `min_overlap` as in `match_tracks`.
+
+    Args:
+        gpx_gdf (GeoDataFrame): Simplified tracks in EPSG:3812, with
+            MATCH_TRACK_COLUMNS and a `track_key` column.
+        bike_network (GeoDataFrame): GeoDataFrame of bike network segments.
+        min_overlap (float): Minimum overlap fraction of a matched segment.
+
+    Returns:
+        GeoDataFrame: Same layout as `match_tracks`, with the covered length
+            as `intersection_length`. The overlap is only computed at
+            BUFFER_DISTANCE_M, the width of the corridors; the other
+            OVERLAP_COLUMNS are NaN.
+    """
+    empty = _empty_matches(bike_network)
+    if gpx_gdf.empty:
+        return empty
+
+    # --- densify GPX geometries into vertices ---
+    progress_state["current-task"] = "Densifying GPX geometries"
+    progress_state["pct"] = 60
+    dense = shapely.segmentize(gpx_gdf.geometry.values, CORRIDOR_DENSIFY_M)
+    coords, point_track = shapely.get_coordinates(dense, return_index=True)
+    points = shapely.points(coords)
+
+    # --- spatial index: find the segment corridors each vertex lies in ---
+    progress_state["current-task"] = "Matching all GPX tracks with bike network"
+    progress_state["pct"] = 65
+    # (bounding box query, then the point-in-polygon test on the prepared corridors:
+    # a "within" predicate in the query would prepare the points instead)
+    corridors, tree = get_network_index(bike_network).corridors()
+    point_idx, seg_idx = tree.query(points)
+    inside = shapely.contains(corridors[seg_idx], points[point_idx])
+    point_idx, seg_idx = point_idx[inside], seg_idx[inside]
+    if len(point_idx) == 0:
+        return empty
+
+    # --- covered lengths: count the segment bins reached by each track ---
+    progress_state["current-task"] = "Calculating covered segment lengths"
+    progress_state["pct"] = 75
+    seg_geoms = bike_network.geometry.values
+    pair_seg, pair_track, overlap_percentage, _, _ = _binned_overlaps(
+        seg_geoms, points, point_idx, seg_idx, point_track, len(gpx_gdf)
+    )
+
+    # --- filter segments by minimum overlap and add the track columns ---
+    return _matched_pairs(
+        gpx_gdf, bike_network, pair_seg, pair_track,
+        overlap_percentage * shapely.length(seg_geoms[pair_seg]),
+        {BUFFER_DISTANCE_M: overlap_percentage}, min_overlap
+    )
+
+def _binned_overlaps(seg_geoms, points, point_idx, seg_idx, point_track, n_tracks):
+    """
+    Estimate the overlap of (segment, track) pairs from the track vertices
+    near the segments, as the fraction of the CORRIDOR_BIN_M bins of a
+    segment onto which a vertex of the track projects.
+
+    Args:
+        seg_geoms (ndarray): Segment geometries.
+        points (ndarray): Track vertices.
+        point_idx (ndarray): Vertex position of each (vertex, segment) hit.
+        seg_idx (ndarray): Segment position of each hit.
+        point_track (ndarray): Track position of each vertex.
+        n_tracks (int): Number of tracks.
+
+    Returns:
+        tuple:
+            ndarray: Segment position of each pair.
+            ndarray: Track position of each pair.
+            ndarray: Overlap fraction of each pair.
+            ndarray: Pair of each hit.
+            ndarray: Position of each hit along its segment, as a fraction.
+    """
+    segment_length = shapely.length(seg_geoms)
+    n_bins = np.maximum(1, np.ceil(segment_length / CORRIDOR_BIN_M)).astype(np.int64)
+    position = shapely.line_locate_point(seg_geoms[seg_idx], points[point_idx])
+    length = segment_length[seg_idx]
+    fraction = np.divide(position, length, out=np.zeros(len(position)), where=length > 0)
+    seg_bin = np.minimum((fraction * n_bins[seg_idx]).astype(np.int64), n_bins[seg_idx] - 1)
+
+    pair = seg_idx.astype(np.int64) * n_tracks + point_track[point_idx]
+    covered = np.unique(pair * n_bins.max() + seg_bin) // n_bins.max()
+    pairs, covered_bins = np.unique(covered, return_counts=True)
+    pair_seg, pair_track = np.divmod(pairs, n_tracks)
+    overlap_percentage = np.where(segment_length[pair_seg] > 0, covered_bins / n_bins[pair_seg], 0.0)
+    return pair_seg, pair_track, overlap_percentage, np.searchsorted(pairs, pair), fraction
+
+def _adjacent_segments(segments, graph):
+    """Return the rows of `segments` and of the segments sharing an end node with them."""
+    indptr, adjacency, segment_nodes = graph
+    nodes = segment_nodes[segments].ravel()
+    return np.unique(np.concatenate(
+        [segments] + [adjacency[indptr[n]:indptr[n + 1]] for n in nodes[nodes >= 0]]
+    ))
+
+def _walk_track(points, seg_geoms, tree, graph):
+    """
+    Walk the vertices of one track in order and return the (vertex, segment)
+    position pairs within BUFFER_DISTANCE_M, following the network graph.
+
+    Each step tests the next vertices against the segments around the last
+    matched ones; the spatial index `tree` is only queried when none of them
+    is near anymore.
+    """
+    hit_points, hit_segs = [], []
+    candidates = np.empty(0, dtype=np.int64)
+    i, window = 0, GRAPH_WALK_MIN_VERTICES
+    while i < len(points):
+        if len(candidates):
+            near = shapely.dwithin(points[i:i + window, None], seg_geoms[candidates], BUFFER_DISTANCE_M)
+            covered = near.any(axis=1)
+            k = len(covered) if covered.all() else int(np.argmin(covered))
+            if k:
+                p, s = np.nonzero(near[:k])
+                hit_points.append(i + p)
+                hit_segs.append(candidates[s])
+                # go on from the segments near the last covered vertex
+                candidates = _adjacent_segments(candidates[near[k - 1]], graph)
+                window = min(2 * window, GRAPH_WALK_MAX_VERTICES) if k == len(covered) else GRAPH_WALK_MIN_VERTICES
+                i += k
+                continue
+
+        # the chain broke: look up the next vertex near any segment
+        p, s = tree.query(
+            points[i:i + GRAPH_WALK_MAX_VERTICES], predicate="dwithin", distance=BUFFER_DISTANCE_M
+        )
+        if len(p) == 0:
+            candidates = np.empty(0, dtype=np.int64)
+            i += GRAPH_WALK_MAX_VERTICES
+            continue
+        found = s[p == p.min()]
+        hit_points.append(np.full(len(found), i + p.min()))
+        hit_segs.append(found)
+        candidates = _adjacent_segments(found, graph)
+        window = GRAPH_WALK_MIN_VERTICES
+        i += p.min() + 1
+
+    if not hit_points:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(hit_points), np.concatenate(hit_segs)
+
+def match_tracks_graph(gpx_gdf, bike_network, min_overlap=INTERSECT_THRESHOLD):
+    """
+    Match projected GPX tracks with the bike network segments by walking each
+    track along the network graph.
+
+    The tracks are densified to CORRIDOR_DENSIFY_M and their vertices are
+    visited in order. Only the segments sharing a node with the segments
+    matched last are tested against the next vertices, within
+    BUFFER_DISTANCE_M; the spatial index is only queried where this chain
+    breaks, at the start of a track or after it left the network (see
+    `_walk_track`). The overlap is estimated from segment bins as in
+    `match_tracks_corridor`.
+
+    The walk also places every matched segment along the track: the position
+    (m) where the track passes its start and end node orders the matched
+    nodes of each track.
+
+    Args:
+        gpx_gdf (GeoDataFrame): Simplified tracks in EPSG:3812, with
+            MATCH_TRACK_COLUMNS and a `track_key` column.
+        bike_network (GeoDataFrame): GeoDataFrame of bike network segments.
+        min_overlap (float): Minimum overlap fraction of a matched segment.
+
+    Returns:
+        GeoDataFrame: Same layout as `match_tracks_corridor`, with the track
+            positions of the segment end nodes as `track_position_from` and
+            `track_position_to`.
+    """
+    empty = _empty_matches(bike_network)
+    if gpx_gdf.empty:
+        return empty
+
+    # --- densify GPX geometries into vertices ---
+    progress_state["current-task"] = "Densifying GPX geometries"
+    progress_state["pct"] = 60
+    dense = shapely.segmentize(gpx_gdf.geometry.values, CORRIDOR_DENSIFY_M)
+    coords, point_track = shapely.get_coordinates(dense, return_index=True)
+    points = shapely.points(coords)
+    track_start = np.searchsorted(point_track, np.arange(len(gpx_gdf) + 1))
+    # position of each vertex along its track
+    step = np.zeros(len(coords))
+    step[1:] = np.hypot(*np.diff(coords, axis=0).T)
+    along = np.cumsum(step)
+    along -= along[track_start[point_track]]
+
+    # --- walk the tracks along the network graph ---
+    progress_state["current-task"] = "Matching all GPX tracks with bike network"
+    progress_state["pct"] = 65
+    network = get_network_index(bike_network)
+    graph = network.graph()
+    seg_geoms = bike_network.geometry.values
+    point_idx, seg_idx = [], []
+    for start, end in zip(track_start[:-1], track_start[1:]):
+        p, s = _walk_track(points[start:end], seg_geoms, network.tree, graph)
+        point_idx.append(start + p)
+        seg_idx.append(s)
+    point_idx, seg_idx = np.concatenate(point_idx), np.concatenate(seg_idx)
+    if len(point_idx) == 0:
+        return empty
+
+    # --- covered lengths: count the segment bins reached by each track ---
+    progress_state["current-task"] = "Calculating covered segment lengths"
+    progress_state["pct"] = 75
+    pair_seg, pair_track, overlap_percentage, hit_pair, fraction = _binned_overlaps(
+        seg_geoms, points, point_idx, seg_idx, point_track, len(gpx_gdf)
+    )
+    # the track passes the start node of a segment at its vertex closest to the
+    # start of the segment, and the end node at the one closest to the end
+    order = np.lexsort((fraction, hit_pair))
+    first = np.searchsorted(hit_pair[order], np.arange(len(pair_seg)))
+    last = np.append(first[1:], len(order)) - 1
+    hit_along = along[point_idx[order]]
+
+    # --- filter segments by minimum overlap and add the track columns ---
+    return _matched_pairs(
+        gpx_gdf, bike_network, pair_seg, pair_track,
+        overlap_percentage * shapely.length(seg_geoms[pair_seg]),
+        {BUFFER_DISTANCE_M: overlap_percentage}, min_overlap,
+        positions=(hit_along[first], hit_along[last])
+    )
+
+def get_matcher():
+    """Return the matching function of MATCH_ENGINE."""
+    return {
+        "buffer": match_tracks,
+        "corridor": match_tracks_corridor,
+        "graph": match_tracks_graph,
+    }[MATCH_ENGINE]
+
+def get_match_params():
+    """
+    Return MATCH_ENGINE and the parameters of its own that its matches depend
+    on, as the name of its match cache (see `load_cached_matches`).
+    """
+    params = {
+        "buffer": f"p{TRACK_PIECE_LENGTH_M}_o{OVERLAP_SAMPLE_M}",
+        "corridor": f"c{CORRIDOR_SIMPLIFY_M}_v{CORRIDOR_DENSIFY_M}_n{CORRIDOR_BIN_M}",
+        "graph": (
+            f"v{CORRIDOR_DENSIFY_M}_n{CORRIDOR_BIN_M}"
+            f"_w{GRAPH_WALK_MIN_VERTICES}-{GRAPH_WALK_MAX_VERTICES}"
+        ),
+    }[MATCH_ENGINE]
+    return f"{MATCH_ENGINE}_{params}"
+
+def get_match_distances():
+    """Return the buffer distances MATCH_ENGINE computes an overlap for."""
+    return BUFFER_DISTANCES_M if MATCH_ENGINE == "buffer" else (BUFFER_DISTANCE_M,)
+
+def cluster_routes(gpx_gdf):
+    """
+    Group near-identical tracks, so that only one of each group is matched.
+
+    Tracks are fingerprinted by the ROUTE_CLUSTER_CELL_M grid cells of their
+    start and end point and their length; within a fingerprint, a track joins
+    the first representative it stays within ROUTE_CLUSTER_TOLERANCE_M of,
+    both ways (a Hausdorff distance check on points sampled every
+    ROUTE_CLUSTER_SAMPLE_M), or becomes a representative itself. Tracks ridden
+    in opposite directions are not grouped.
+
+    Args:
+        gpx_gdf (GeoDataFrame): Projected tracks.
+
+    Returns:
+        ndarray: Position of the representative of each track, its own
+            position for representatives.
+    """
+    geoms = np.asarray(gpx_gdf.geometry.values)
+    representative = np.arange(len(geoms))
+    tracks = np.flatnonzero(~shapely.is_empty(geoms))
+    if len(tracks) < 2:
+        return representative
+
+    # --- fingerprint: start cell, end cell and length bucket ---
+    ends = shapely.get_coordinates(
+        shapely.line_interpolate_point(geoms[tracks, None], [0, 1], normalized=True).ravel()
+    ).reshape(-1, 4)
+    fingerprint = np.column_stack([
+        np.floor(ends / ROUTE_CLUSTER_CELL_M),
+        np.floor(shapely.length(geoms[tracks]) / ROUTE_CLUSTER_CELL_M)
+    ]).astype(np.int64)
+    _, group, counts = np.unique(fingerprint, axis=0, return_inverse=True, return_counts=True)
+    group = group.ravel()
+
+    # --- compare the candidates of each fingerprint with sampled points ---
+    for g in np.flatnonzero(counts > 1):
+        reps = []
+        for i in tracks[group == g]:
+            shapely.prepare(geoms[i])
+            n_samples = int(shapely.length(geoms[i]) // ROUTE_CLUSTER_SAMPLE_M) + 2
+            points = shapely.line_interpolate_point(geoms[i], np.linspace(0, 1, n_samples), normalized=True)
+            for rep, rep_points in reps:
+                # (prepared track first, so the distance test uses its index)
+                if shapely.dwithin(geoms[rep], points, ROUTE_CLUSTER_TOLERANCE_M).all() \
+                        and shapely.dwithin(geoms[i], rep_points, ROUTE_CLUSTER_TOLERANCE_M).all():
+                    representative[i] = rep
+                    break
+            else:
+                reps.append((i, points))
+    return representative
+
+def propagate_route_matches(matches, gpx_gdf, representative):
+    """
+    Copy the matched segments of each representative track to the other
+    tracks of its group (see `cluster_routes`), with their own track columns.
+
+    Args:
+        matches (GeoDataFrame): Matched segments of the representatives.
+        gpx_gdf (GeoDataFrame): All tracks, with MATCH_TRACK_COLUMNS and `track_key`.
+        representative (ndarray): Position of the representative of each track.
+
+    Returns:
+        GeoDataFrame: Matched segments of all tracks.
+    """
+    members = np.flatnonzero(representative != np.arange(len(representative)))
+    if matches.empty or len(members) == 0:
+        return matches
+    track_cols = MATCH_TRACK_COLUMNS + ["track_key"]
+    member_info = gpx_gdf[track_cols].iloc[members].assign(
+        representative_key=gpx_gdf["track_key"].values[representative[members]]
+    )
+    copies = matches.drop(columns=track_cols).assign(
+        representative_key=matches["track_key"].values
+    ).merge(member_info, on="representative_key")
+    return gpd.GeoDataFrame(
+        pd.concat([matches, copies[matches.columns]], ignore_index=True),
+        geometry=matches.geometry.name, crs=matches.crs
+    )
+
+def parse_gpx_chunk(gpx_files, zip_file_path, shared=False, use_cache=False, track_filter=None):
+    """
+    Parse a chunk of GPX members in one worker task (see `parse_gpx_member`).
+
+    Returns:
+        list: (member name, content hash, track batch) per member.
+    """
+    results = []
+    try:
+        for gpx_file in gpx_files:
+            results.append(
+                (gpx_file, *parse_gpx_member(gpx_file, zip_file_path, shared, use_cache, track_filter))
+            )
+    except BaseException:
+        # nobody will read the blocks shared for the members parsed so far
+        _release_shared_batches([batch for _, _, batch in results])
+        raise
+    return results
+
+def parse_worker_count(file_sizes):
+    """
+    Pick the number of parse workers from the available CPU cores and memory
+    (within the container memory limit, see `_available_memory`).
+
+    Each worker is assumed to need WORKER_BASE_MEMORY_MB plus a multiple of
+    the largest file size, so memory-constrained hosts get fewer workers
+    instead of none.
+
+    Args:
+        file_sizes (list): Uncompressed sizes of the GPX members in bytes.
+
+    Returns:
+        int: Number of workers, 1 meaning sequential parsing.
+    """
+    return _worker_count(
+        WORKER_BASE_MEMORY_MB * 1024**2
+        + WORKER_MEMORY_PER_FILE_BYTE * max(file_sizes, default=0)
+    )
+
+def _available_memory():
+    """
+    Return the memory (bytes) available to this process tree: the host's
+    available memory, capped by the container limit (MEMORY_LIMIT_ENV or the
+    cgroup limit) minus the memory already in use.
+    """
+    available = psutil.virtual_memory().available
+    if os.getenv(MEMORY_LIMIT_ENV):
+        limit = int(float(os.getenv(MEMORY_LIMIT_ENV)) * 1024**2)
+        process = psutil.Process()
+        # children are forked: only their unique memory (USS) adds to the parent's RSS,
+        # the copy-on-write pages they share with it are already counted there
+        used = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                used += child.memory_full_info().uss
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+        return min(available, limit - used)
+    for limit_file, usage_file in CGROUP_MEMORY_FILES:
+        try:
+            with open(limit_file) as f:
+                limit = f.read().strip()
+            with open(usage_file) as f:
+                usage = int(f.read().strip())
+        except (OSError, ValueError):
+            continue
+        # "max" (v2) or a huge number (v1) means no limit
+        if limit.isdigit() and int(limit) < psutil.virtual_memory().total:
+            return min(available, int(limit) - usage)
+    return available
+
+def _worker_count(per_worker):
+    """Number of workers that fit in the CPU cores and the available memory (bytes per worker)."""
+    cores = os.cpu_count() or 1
+    if cores < PARALLEL_MIN_CORES:
+        return 1
+    available = _available_memory() - MEMORY_RESERVE_MB * 1024**2
+    by_memory = int(available // per_worker)
+    return max(1, min(DEFAULT_MAX_WORKERS, cores, by_memory))
+
+def chunk_gpx_files(gpx_files, file_sizes, n_workers):
+    """
+    Group GPX members into parse tasks of roughly equal (uncompressed) size.
+
+    The chunk size adapts to the archive: at most PARSE_CHUNK_BYTES, but small
+    enough to give every worker PARSE_TASKS_PER_WORKER tasks. Largest files
+    are scheduled first so that no big file ends up last in the queue.
+
+    Args:
+        gpx_files (list): Names of the GPX members.
+        file_sizes (list): Uncompressed sizes of the members in bytes.
+        n_workers (int): Number of parse workers.
+
+    Returns:
+        list: Lists of member names.
+    """
+    target = min(PARSE_CHUNK_BYTES, sum(file_sizes) / (n_workers * PARSE_TASKS_PER_WORKER))
+    chunks, chunk, chunk_bytes = [], [], 0
+    for size, gpx_file in sorted(zip(file_sizes, gpx_files), reverse=True):
+        chunk.append(gpx_file)
+        chunk_bytes += size
+        if chunk_bytes >= target:
+            chunks.append(chunk)
+            chunk, chunk_bytes = [], 0
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+def batch_tracks(gpx_gdf, n_batches):
+    """
+    Split a track GeoDataFrame into at most `n_batches` consecutive batches
+    holding roughly the same number of vertices.
+    """
+    weight = np.cumsum(shapely.get_num_coordinates(gpx_gdf.geometry.values))
+    if len(weight) == 0:
+        return []
+    bounds = np.searchsorted(weight, np.linspace(0, weight[-1], n_batches + 1)[1:-1])
+    bounds = np.concatenate([[0], bounds, [len(gpx_gdf)]])
+    return [gpx_gdf.iloc[a:b] for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+def _init_worker(bike_network):
+    """
+    Pool initializer: keep the bike network and warm up this worker, so the
+    first task of a job doesn't pay for building indexes or loading pyproj.
+    """
+    global _worker_network
+    _worker_network = bike_network
+    if bike_network is not None:
+        network = get_network_index(bike_network)
+        if MATCH_ENGINE == "corridor":
+            network.corridors()
+        elif MATCH_ENGINE == "graph":
+            network.graph()
+    pyproj.Transformer.from_crs("EPSG:4326", "EPSG:3812", always_xy=True)
+
+def get_worker_pool(n_workers, bike_network=None):
+    """
+    Return the long-lived worker pool, with at least `n_workers` workers.
+
+    The pool is created on first use (or at app startup, see
+    `start_worker_pool`) and kept for later jobs. It is only recreated when
+    it is too small, broken, or was started for other network data. A job
+    sized for fewer workers than the pool has runs its tasks through
+    `submit_bounded`, so it never uses more of them at a time.
+
+    Args:
+        n_workers (int): Number of workers needed.
+        bike_network (GeoDataFrame, optional): Bike network segments the
+            workers match against.
+
+    Returns:
+        ProcessPoolExecutor: The worker pool.
+    """
+    global _pool, _pool_workers, _pool_network
+    stale = bike_network is not None and bike_network is not _pool_network
+    if _pool is None or n_workers > _pool_workers or stale or getattr(_pool, "_broken", False):
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        network = bike_network if bike_network is not None else _pool_network
+        if network is not None and MATCH_ENGINE == "corridor":
+            # build the corridors (or graph) once here, forked workers inherit them
+            get_network_index(network).corridors()
+        elif network is not None and MATCH_ENGINE == "graph":
+            get_network_index(network).graph()
+        _pool = ProcessPoolExecutor(
+            max_workers=n_workers, initializer=_init_worker, initargs=(network,)
+        )
+        _pool_workers = max(n_workers, 1)
+        _pool_network = network
+    return _pool
+
+def submit_bounded(executor, fn, tasks, n_workers, futures):
+    """
+    Run `fn` over `tasks` on the executor with at most `n_workers` tasks in
+    flight, whatever the size of the pool, and yield them as they complete.
+
+    Args:
+        executor (ProcessPoolExecutor): Worker pool.
+        fn (callable): Picklable task function.
+        tasks (list): Argument tuples, one per task.
+        n_workers (int): Maximum number of tasks running at the same time.
+        futures (list): Receives every submitted future, so callers can
+            clean up after a failure; tasks not submitted yet never run.
+
+    Yields:
+        tuple: Task position in `tasks` and its completed future.
+    """
+    queue = iter(enumerate(tasks))
+    pending = {}
+    while True:
+        for i, args in itertools.islice(queue, max(n_workers, 1) - len(pending)):
+            future = executor.submit(fn, *args)
+            futures.append(future)
+            pending[future] = i
+        if not pending:
+            return
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield pending.pop(future), future
+
+def start_worker_pool(bike_network):
+    """
+    Start the worker pool with as many workers as cores and memory allow, and
+    spawn them right away. Does nothing on hosts too small for parallel work.
+
+    Workers are sized like match workers (MATCH_WORKER_MEMORY_MB, within the
+    container memory limit, see `_available_memory`), the largest estimate of
+    the jobs they run, so a warm pool never takes memory a job would not.
+
+    Args:
+        bike_network (GeoDataFrame): Bike network segments.
+    """
+    n_workers = _worker_count(max(WORKER_BASE_MEMORY_MB, MATCH_WORKER_MEMORY_MB) * 1024**2)
+    if n_workers <= 1:
+        return
+    pool = get_worker_pool(n_workers, bike_network)
+    # the executor only starts its processes when tasks come in
+    for future in [pool.submit(os.getpid) for _ in range(n_workers)]:
+        future.result()
+
+def shutdown_worker_pool():
+    """Stop the worker pool, if any."""
+    global _pool, _pool_workers, _pool_network
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+    _pool, _pool_workers, _pool_network = None, 0, None
+
+def _match_batch(gpx_gdf, min_overlap):
+    """Match one batch of tracks in a match worker (see `match_tracks_parallel`)."""
+    return get_matcher()(gpx_gdf, _worker_network, min_overlap)
+
+def match_tracks_parallel(gpx_gdf, bike_network, n_workers, min_overlap=INTERSECT_THRESHOLD):
+    """
+    Match tracks in batches over a process pool, see `match_tracks`.
+
+    Runs on the long-lived worker pool (see `get_worker_pool`). Workers
+    receive the bike network once, through the pool initializer: with the
+    default fork start method on Linux it is inherited copy-on-write together
+    with the parent's `NetworkIndex`, so workers don't rebuild any index.
+
+    Args:
+        gpx_gdf (GeoDataFrame): Tracks to match, see `match_tracks`.
+        bike_network (GeoDataFrame): GeoDataFrame of bike network segments.
+        n_workers (int): Number of match workers.
+        min_overlap (float): Minimum overlap fraction of a matched segment.
+
+    Returns:
+        GeoDataFrame: Matched segments of all batches, in track order.
+    """
+    batches = batch_tracks(gpx_gdf, n_workers * MATCH_TASKS_PER_WORKER)
+    executor = get_worker_pool(n_workers, bike_network)
+
+    results = [None] * len(batches)
+    tasks = [(batch, min_overlap) for batch in batches]
+    completed = submit_bounded(executor, _match_batch, tasks, n_workers, [])
+    for done, (i, future) in enumerate(completed, start=1):
+        results[i] = future.result()
+        progress_state["current-task"] = f"Matching GPX tracks (parallel): {done}/{len(batches)} batches"
+        progress_state["pct"] = 60 + round(done / len(batches) * 15)
+    return gpd.GeoDataFrame(pd.concat(results, ignore_index=True), crs=bike_network.crs)
 
 # --- main function ---
-def process_gpx_zip(zip_file_path, bike_network, point_geodf):
+def process_gpx_zip(zip_file_path, bike_network, point_geodf,
+                    activity_types=None, start_date=None, end_date=None,
+                    min_overlap=INTERSECT_THRESHOLD, buffer_distance=BUFFER_DISTANCE_M):
     """
     Process a ZIP archive of GPX files and match tracks with a bike network.
 
-    This function unzips the GPX files, parses each track into geometries,
+    This function streams the GPX files out of the ZIP, parses each track into geometries,
     buffers them, calculates overlap with the bike network segments, filters
     segments exceeding the overlap threshold, and extracts corresponding bike nodes.
 
     Progress updates are written to `progress_state` throughout the steps.
 
     Uses sequential parsing for a small number of files and parallel parsing
-    for larger ZIPs to improve performance.
+    for larger ZIPs to improve performance, on the long-lived worker pool
+    (see `get_worker_pool`). GPX files whose content is already
+    in the on-disk track cache are not parsed again (see `USE_TRACK_CACHE`).
+
+    Tracks can be restricted to some activity types and a date range; these
+    filters are applied while parsing, so rejected tracks never get a geometry.
+    The same goes for activities found more than once, e.g. in exports from
+    several sources (see `USE_DUPLICATE_DETECTION`): only one of them is kept,
+    and the number skipped is left in `progress_state["skipped-duplicates"]`.
+
+    Tracks are always matched (and cached) down to MIN_OVERLAP_FRACTION; the
+    results keep the `overlap_percentage` of every segment and node, at
+    BUFFER_DISTANCE_M and at each distance in OVERLAP_COLUMNS, so another
+    threshold or buffer distance can be applied later by filtering alone.
 
     Args:
         zip_file_path (str): Path to the ZIP file containing GPX files.
         bike_network (GeoDataFrame): GeoDataFrame of bike network segments.
         point_geodf (GeoDataFrame): GeoDataFrame of bike nodes.
+        activity_types (Iterable, optional): Activity categories to keep, as
+            returned by `map_activity_type`. Defaults to all.
+        start_date (date, optional): Earliest track date to keep.
+        end_date (date, optional): Latest track date to keep.
+        min_overlap (float, optional): Minimum overlap fraction of the returned
+            segments, not below MIN_OVERLAP_FRACTION.
+        buffer_distance (int, optional): Buffer distance (m) at which the
+            segments must reach `min_overlap`, one of BUFFER_DISTANCES_M; None
+            keeps the segments reaching it at any of these distances.
 
     Returns:
         tuple:
             GeoDataFrame: Matched bike network segments with GPX metadata.
-            GeoDataFrame: Matched bike nodes corresponding to the segments.
+            GeoDataFrame: Matched bike nodes corresponding to the segments,
+                in track order when matched with the "graph" engine (see
+                `track_position`).
             GeoDataFrame: Original GPX tracks with simplified geometry.
 
     Note:
-        An alternative approach that processes GPX files individually with
-        concurrency was tested and performs well locally, but is not suitable
-        on Render free tier due to limited CPU and memory.
-    """
-    # --- unzip ---
-    zip_folder = os.path.join(UPLOAD_FOLDER, "temp")
-    if os.path.exists(zip_folder):
-        shutil.rmtree(zip_folder)
-    os.makedirs(zip_folder, exist_ok=True)
+        The number of parse workers follows from the available memory (see
+        `parse_worker_count`), so hosts with limited CPU and memory such as
+        the Render free tier fall back to fewer workers or sequential parsing.
+    """
+    # --- list GPX members (read in place, no extraction) ---
     with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
-        zip_ref.extractall(zip_folder)
-
-    gpx_files = [f for f in os.listdir(zip_folder) if f.lower().endswith(".gpx")]
+        gpx_files = list_gpx_members(zip_ref)
+        file_sizes = member_sizes(zip_ref, gpx_files)
     total_files = len(gpx_files)
     if total_files == 0:
-        return gpd.GeoDataFrame(), gpd.GeoDataFrame()
+        return gpd.GeoDataFrame(), gpd.GeoDataFrame(), gpd.GeoDataFrame()
+
+    track_filter = make_track_filter(activity_types, start_date, end_date)
+    network = get_network_index(bike_network, point_geodf)
 
     # --- parse GPX files ---
-    gpx_rows = []
-    # added as environment variable in Render; used to disable parallel processing
-    # on the free tier to prevent crashes or memory issues
-    IS_RENDER = os.getenv("RENDER") == "true"
-    use_parallel = (
-        not IS_RENDER
-        and os.cpu_count() >= PARALLEL_MIN_CORES
-        and total_files >= PARALLEL_MIN_FILES
-    )
+    # columnar batches, with the content hash of every track in row order
+    gpx_batches, batch_hashes = [], []
+    parsed_hashes = []   # content hashes of all parsed files (also those without tracks)
+    cached_members = []  # (member, content hash) of files found in the track cache
+
+    def collect(gpx_file, digest, batch):
+        """Sort the result of `parse_gpx_member` by where its tracks come from."""
+        if batch is None:
+            cached_members.append((gpx_file, digest))
+            return
+        parsed_hashes.append(digest)
+        if not batch[0]:
+            return
+        if isinstance(batch[1], tuple):
+            # copy the coordinates out of the shared block as soon as it arrives, then free it
+            batch = _read_shared_batch(batch)
+        gpx_batches.append(batch)
+        batch_hashes.extend([digest] * len(batch[0]))
+
+    n_workers = parse_worker_count(file_sizes) if total_files >= PARALLEL_MIN_FILES else 1
+    use_parallel = n_workers > 1
 
     if not use_parallel:
         # Sequential parsing
-        for i, gpx_file in enumerate(gpx_files, start=1):
-            progress_state["show-dots"] = False
-            progress_state["current-task"] = f"Parsing GPX files: {i}/{total_files}"
-            progress_state["pct"] = round(i / total_files * 50)
-            results = parse_single_gpx(gpx_file, zip_folder)   # list of dicts
-            if results:
-                gpx_rows.extend(results)
+        with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
+            for i, gpx_file in enumerate(gpx_files, start=1):
+                progress_state["show-dots"] = False
+                progress_state["current-task"] = f"Parsing GPX files: {i}/{total_files}"
+                progress_state["pct"] = round(i / total_files * 50)
+                collect(gpx_file, *parse_gpx_member(
+                    gpx_file, zip_ref, use_cache=USE_TRACK_CACHE, track_filter=track_filter
+                ))
     else:
-        # Parallel parsing
-        max_workers = min(DEFAULT_MAX_WORKERS, os.cpu_count())
+        # Parallel parsing on the worker pool, in chunks of files per task
+        executor = get_worker_pool(n_workers, bike_network)
+        tasks = [
+            (chunk, zip_file_path, USE_SHARED_MEMORY, USE_TRACK_CACHE, track_filter)
+            for chunk in chunk_gpx_files(gpx_files, file_sizes, n_workers)
+        ]
         futures = []
-        with ProcessPoolExecutor(max_workers=max_workers) as executor:
-            for gpx_file in gpx_files:
-                futures.append(executor.submit(parse_single_gpx, gpx_file, zip_folder))
-            for i, future in enumerate(as_completed(futures), start=1):
+        done = 0
+        consumed, results = set(), []
+        try:
+            for _, future in submit_bounded(executor, parse_gpx_chunk, tasks, n_workers, futures):
+                consumed.add(future)
                 results = future.result()
-                if results:
-                    gpx_rows.extend(results)
-                progress_state["current-task"] = f"Parsing GPX files (parallel): {i}/{total_files}"
-                progress_state["pct"] = round(i / total_files * 50)
+                while results:
+                    collect(*results.pop(0))
+                    done += 1
+                progress_state["current-task"] = f"Parsing GPX files (parallel): {done}/{total_files}"
+                progress_state["pct"] = round(done / total_files * 50)
+        except BaseException:
+            # the workers handed their shared memory blocks over to this process:
+            # free those of the results that won't be collected anymore
+            _release_shared_batches([batch for _, _, batch in results])
+            for future in futures:
+                if future in consumed or future.cancel():
+                    continue
+                try:
+                    _release_shared_batches([batch for _, _, batch in future.result()])
+                except Exception:
+                    pass
+            raise
+
+    # --- load cached tracks (and parse those evicted in the meantime after all) ---
+    cached_gdf, missing = load_cached_tracks(cached_members)
+    if missing:
+        with zipfile.ZipFile(zip_file_path, 'r') as zip_ref:
+            for gpx_file, _ in missing:
+                collect(gpx_file, *parse_gpx_member(gpx_file, zip_ref, track_filter=track_filter))
+    if track_filter is not None and not cached_gdf.empty:
+        cached_gdf = cached_gdf[[
+            _track_accepted(track_filter, map_activity_type(activity_type), track_date)
+            for activity_type, track_date in zip(cached_gdf["activity_type"], cached_gdf["track_date"])
+        ]]
+
+    # --- skip duplicate activities, on their metadata, before building the track geometries ---
+    progress_state["skipped-duplicates"] = 0
+    if USE_DUPLICATE_DETECTION:
+        new_tracks = pd.DataFrame(
+            [row for batch in gpx_batches for row in batch[0]], columns=TRACK_META_COLUMNS
+        )
+        new_tracks["content_hash"] = batch_hashes
+        track_cols = ["track_uid", "track_fingerprint", "content_hash"]
+        tracks = pd.concat(
+            [new_tracks[track_cols]] + ([cached_gdf[track_cols]] if not cached_gdf.empty else []),
+            ignore_index=True
+        )
+        duplicate = _duplicate_tracks(tracks["track_fingerprint"], tracks["track_uid"])
+        if duplicate.any():
+            n_duplicates = int(duplicate.sum())
+            progress_state["skipped-duplicates"] = n_duplicates
+            progress_state["current-task"] = f"Skipped {n_duplicates} duplicate activities"
+
+            # a file keeps its cache shard only if its dropped tracks are kept under
+            # the same content hash and track index (identical copies of the file)
+            tracks["track_key"] = track_keys(tracks)
+            kept_keys = set(tracks.loc[~duplicate, "track_key"])
+            incomplete = set(tracks.loc[
+                duplicate & ~tracks["track_key"].isin(kept_keys), "content_hash"
+            ])
+            parsed_hashes = [digest for digest in parsed_hashes if digest not in incomplete]
 
-    if not gpx_rows:
-        return gpd.GeoDataFrame(), gpd.GeoDataFrame()
+            keep = ~duplicate
+            n_new = len(new_tracks)
+            batch_keep = np.split(
+                keep[:n_new], np.cumsum([len(batch[0]) for batch in gpx_batches])[:-1]
+            )
+            # the coordinates of the dropped tracks are discarded with their batch
+            gpx_batches = [
+                _select_tracks(batch, kept)
+                for batch, kept in zip(gpx_batches, batch_keep) if kept.any()
+            ]
+            batch_hashes = [digest for digest, kept in zip(batch_hashes, keep) if kept]
+            cached_gdf = cached_gdf[keep[n_new:]]
 
-    all_gpx_gdf = gpd.GeoDataFrame(gpx_rows, crs="EPSG:4326")
+    if not batch_hashes and cached_gdf.empty:
+        return gpd.GeoDataFrame(), gpd.GeoDataFrame(), gpd.GeoDataFrame()
 
-    # --- reproject ---
+    frames = []
+    if gpx_batches:
+        # build all track geometries at once from the columnar batches
+        frames.append(
+            tracks_to_geodataframe(gpx_batches, crs="EPSG:4326").assign(content_hash=batch_hashes)
+        )
+
+    # --- reproject & simplify newly parsed GPX geometries ---
     progress_state["show-dots"] = True
     progress_state["current-task"] = "Reprojecting GPX geometries to Lambert 2008"
     progress_state["pct"] = 55
-    all_gpx_gdf = all_gpx_gdf.to_crs("EPSG:3812")
-
-    # --- simplify & buffer GPX geometries---
-    progress_state["current-task"] = "Buffering GPX geometries"
-    progress_state["pct"] = 60
-    all_gpx_gdf['geometry'] = all_gpx_gdf['geometry'].simplify(
-        tolerance=SIMPLIFY_TOLERANCE_M/2, preserve_topology=True
-    )
-    all_gpx_gdf["buffer_geom"] = all_gpx_gdf.geometry.buffer(BUFFER_DISTANCE_M)
-    gpx_buffers = all_gpx_gdf.set_geometry("buffer_geom")
+    if frames:
+        new_gpx_gdf = gpd.GeoDataFrame(pd.concat(frames, ignore_index=True), crs="EPSG:4326")
+        new_gpx_gdf = new_gpx_gdf.to_crs("EPSG:3812")
+        new_gpx_gdf['geometry'] = new_gpx_gdf['geometry'].simplify(
+            tolerance=SIMPLIFY_TOLERANCE_M/2, preserve_topology=True
+        )
+    else:
+        new_gpx_gdf = gpd.GeoDataFrame(
+            columns=TRACK_COLUMNS + ["content_hash"], geometry="geometry", crs="EPSG:3812"
+        )
 
-    # --- spatial join: find all segments that intersect each GPX track buffer ---
-    progress_state["current-task"] = "Matching all GPX tracks with bike network"
-    progress_state["pct"] = 65
-    joined = gpd.sjoin(
-        bike_network,
-        gpx_buffers[["gpx_name", "track_name", "track_date", "track_uid", "buffer_geom"]],
-        how="inner",
-        predicate="intersects"
+    # --- update track cache and add the cached tracks ---
+    # (filtered parses miss the rejected tracks, so they are not cached)
+    if USE_TRACK_CACHE and track_filter is None:
+        store_cached_tracks(new_gpx_gdf, parsed_hashes)
+        evict_cached_tracks()
+    all_gpx_gdf = gpd.GeoDataFrame(
+        pd.concat(
+            [gdf for gdf in (new_gpx_gdf, cached_gdf) if not gdf.empty], ignore_index=True
+        )[TRACK_COLUMNS + ["content_hash"]],
+        crs="EPSG:3812"
     )
 
-    if joined.empty:
-        progress_state["current-task"] = "No intersections found."
-        progress_state["pct"] = 100
-        return gpd.GeoDataFrame(), gpd.GeoDataFrame()
-
-    joined = joined.reset_index()
+    # --- reuse cached matches of known tracks ---
+    all_gpx_gdf["track_key"] = track_keys(all_gpx_gdf)
+    if USE_MATCH_CACHE:
+        cached_matches, cached_keys = load_cached_matches(all_gpx_gdf["track_key"], get_match_params())
+    else:
+        cached_matches, cached_keys = None, set()
+    gpx_to_match = all_gpx_gdf[~all_gpx_gdf["track_key"].isin(cached_keys)]
+    match_keys = gpx_to_match["track_key"]
+    # tracks (or parts of them) outside the network extent can't match anything
+    gpx_to_match = clip_to_network(gpx_to_match, network)
 
-    # look up buffer geometry
-    joined = joined.merge(
-        all_gpx_gdf[["buffer_geom"]],
-        left_on="index_right", right_index=True, suffixes=("", "_gpx")
-    )
+    # --- group near-identical routes, only their representatives are matched ---
+    if USE_ROUTE_CLUSTERS:
+        progress_state["current-task"] = "Grouping repeated routes"
+        progress_state["pct"] = 58
+        representative = cluster_routes(gpx_to_match)
+    else:
+        representative = np.arange(len(gpx_to_match))
+    gpx_representatives = gpx_to_match.iloc[np.unique(representative)]
 
-    # --- intersection lengths: compute segment overlap with each GPX track buffer ---
-    progress_state["current-task"] = "Calculating intersection lengths"
-    progress_state["pct"] = 75
-    joined["segment_length"] = joined.geometry.length
-    joined["intersection_geom"] = joined.geometry.intersection(joined["buffer_geom"])
-    joined["intersection_length"] = joined["intersection_geom"].length.fillna(0)
-    mask = joined["segment_length"] > 0
-    joined["overlap_percentage"] = 0.0
-    joined.loc[mask, "overlap_percentage"] = (
-        (joined.loc[mask, "intersection_length"] /
-         joined.loc[mask, "segment_length"]).clip(0, 1)
+    # --- match the other tracks ---
+    matcher = get_matcher()
+    n_match_workers = (
+        _worker_count(MATCH_WORKER_MEMORY_MB * 1024**2)
+        if len(gpx_representatives) >= PARALLEL_MATCH_MIN_TRACKS else 1
     )
+    if n_match_workers > 1:
+        new_segments = match_tracks_parallel(
+            gpx_representatives, bike_network, n_match_workers, MIN_OVERLAP_FRACTION
+        )
+    else:
+        new_segments = matcher(gpx_representatives, bike_network, MIN_OVERLAP_FRACTION)
+    if USE_MATCH_CACHE:
+        # only exact matches are cached: the tracks of a group get matched themselves
+        # once they are no longer grouped with their representative
+        members = representative != np.arange(len(representative))
+        member_keys = gpx_to_match["track_key"].values[members]
+        store_cached_matches(new_segments, match_keys[~match_keys.isin(member_keys)], get_match_params())
+        evict_cached_matches()
+    new_segments = propagate_route_matches(new_segments, gpx_to_match, representative)
 
-    # --- filter segments by minimum overlap and remove unnecessary columns ---
-    mask = joined["overlap_percentage"] >= INTERSECT_THRESHOLD
-    drop_cols = [
-        "index", "index_right", "buffer_geom", "segment_length", 
-        "intersection_geom", "intersection_length"
-    ]
-
-    all_segments = joined.loc[mask].drop(columns=drop_cols, errors="ignore").copy()
+    if cached_keys:
+        # rebuild the segment rows of cached matches from the network and track attributes
+        rows = network.segment_positions(cached_matches["osm_id"])
+        known = rows >= 0
+        cached_segments = pd.concat([
+            bike_network.iloc[rows[known]].reset_index(drop=True),
+            cached_matches.loc[known, MATCH_CACHE_COLUMNS[1:] + ["track_key"]].reset_index(drop=True)
+        ], axis=1).merge(all_gpx_gdf[MATCH_TRACK_COLUMNS + ["track_key"]], on="track_key")
+        all_segments = gpd.GeoDataFrame(
+            pd.concat([new_segments, cached_segments[new_segments.columns]], ignore_index=True),
+            crs=bike_network.crs
+        )
+    else:
+        all_segments = new_segments
+    all_segments = all_segments.drop(columns="track_key")
+    if buffer_distance is None:
+        # pairs are kept when they reach min_overlap at any buffer distance
+        overlap = all_segments[list(OVERLAP_COLUMNS.values())].max(axis=1)
+    else:
+        overlap = all_segments[OVERLAP_COLUMNS.get(buffer_distance, "overlap_percentage")]
+    all_segments = all_segments[overlap >= min_overlap]
 
     if all_segments.empty:
         progress_state["current-task"] = "No segments exceeded threshold."
         progress_state["pct"] = 100
-        return gpd.GeoDataFrame(), gpd.GeoDataFrame()
+        return gpd.GeoDataFrame(), gpd.GeoDataFrame(), gpd.GeoDataFrame()
 
     # --- matched nodes ---
     progress_state["current-task"] = "Extracting matched bike nodes"
     progress_state["pct"] = 90
-    nodes_list = []
-    for (gpx_name, track_name, track_date, track_uid), grp in all_segments.groupby(
-        ["gpx_name", "track_name", "track_date", "track_uid"]
-    ):
-        node_ids = pd.Index(
-            grp["osm_id_from"].tolist() + grp["osm_id_to"].tolist()
-        ).dropna().unique().tolist()
-        if not node_ids:
-            continue
-        matched_nodes = point_geodf[point_geodf["osm_id"].isin(node_ids)].copy()
-        if matched_nodes.empty:
-            continue
-        matched_nodes["gpx_name"] = gpx_name
-        matched_nodes["track_name"] = track_name
-        matched_nodes["track_date"] = track_date
-        matched_nodes["track_uid"] = track_uid
-        nodes_list.append(matched_nodes)
-
-    all_nodes = (
-        gpd.GeoDataFrame(pd.concat(nodes_list, ignore_index=True), crs=point_geodf.crs)
-        if nodes_list
-        else gpd.GeoDataFrame(
-            columns=list(point_geodf.columns) + ["gpx_name", "track_name", "track_date", "track_uid"]
+    # one (track, node) row per distinct end node of the matched segments of a track,
+    # carrying the best overlap (at each buffer distance) of the segments reaching it
+    # and the first position along the track where it is passed (graph engine only)
+    overlap_cols = ["overlap_percentage", *OVERLAP_COLUMNS.values()]
+    node_id_vars = MATCH_TRACK_COLUMNS + overlap_cols
+    track_nodes = pd.concat([
+        all_segments[node_id_vars + [f"osm_id_{end}", f"track_position_{end}"]].set_axis(
+            node_id_vars + ["node_id", "track_position"], axis=1
         )
+        for end in ("from", "to")
+    ], ignore_index=True).dropna(subset=["node_id"])
+    node_groups = track_nodes.groupby(["track_uid", "node_id"])
+    track_nodes = track_nodes.assign(
+        **node_groups[overlap_cols].transform("max"),
+        track_position=node_groups["track_position"].transform("min")
+    ).drop_duplicates(["track_uid", "node_id"])
+    track_nodes["node_row"] = network.node_positions(track_nodes["node_id"])
+    track_nodes = track_nodes[track_nodes["node_row"] >= 0].sort_values(
+        MATCH_TRACK_COLUMNS + ["track_position", "node_row"]
+    )
+    all_nodes = gpd.GeoDataFrame(
+        pd.concat([
+            point_geodf.iloc[track_nodes["node_row"].values].reset_index(drop=True),
+            track_nodes[node_id_vars + ["track_position"]].reset_index(drop=True)
+        ], axis=1),
+        geometry=point_geodf.geometry.name, crs=point_geodf.crs
     )
 
     progress_state["show-dots"] = False
     progress_state["current-task"] = "Processing done!"
     progress_state["pct"] = 100
 
-    all_gpx_gdf = all_gpx_gdf.drop(columns="buffer_geom")
+    all_gpx_gdf = all_gpx_gdf.drop(columns=["content_hash", "track_key", "track_fingerprint"])
     all_gpx_gdf["track_length"] = all_gpx_gdf.geometry.length / 1000.0
 
     return all_segments, all_nodes, all_gpx_gdf
 
+def _day_numbers(dates):
+    """Return dates (or date strings) as int64 days since the epoch."""
+    return pd.to_datetime(pd.Series(dates)).to_numpy().astype("datetime64[D]").astype(np.int64)
+
+def _day_strings(days):
+    """Return int64 days since the epoch as YYYY-MM-DD strings."""
+    return np.datetime_as_string(np.asarray(days).astype("datetime64[D]"))
+
+class ResultsIndex:
+    """
+    Columnar index over the results of `process_gpx_zip`, filtering them by
+    date range, minimum overlap and buffer distance without regrouping them.
+
+    Matched segments are reduced to one row per (segment, track) and matched
+    nodes to one row per (node, date), sorted by date, so a date range is a
+    slice found by binary search. Visits per segment or node are counted with
+    `np.bincount` over the rows of that slice reaching the minimum overlap.
+
+    Attributes:
+        segments (GeoDataFrame): One row per segment (SEGMENT_GROUP_COLUMNS),
+            with its `length_km` and geometry.
+        nodes (GeoDataFrame): One row per node (NODE_GROUP_COLUMNS), with its
+            geometry.
+        first_date (date): Date of the first matched segment.
+        last_date (date): Date of the last matched segment.
+    """
+
+    def __init__(self, segments, nodes, gpx):
+        overlap_cols = ["overlap_percentage", *OVERLAP_COLUMNS.values()]
+
+        groups = segments.groupby(SEGMENT_GROUP_COLUMNS, dropna=False)
+        codes = groups.ngroup().to_numpy()
+        self.segments = self._groups(segments, codes, SEGMENT_GROUP_COLUMNS).assign(
+            length_km=groups["length_km"].max().to_numpy()
+        )[[*SEGMENT_GROUP_COLUMNS, "length_km", segments.geometry.name]]
+        self._segment_visits = self._visits(codes, segments, "track_uid", overlap_cols)
+
+        codes = nodes.groupby(NODE_GROUP_COLUMNS, dropna=False).ngroup().to_numpy()
+        self.nodes = self._groups(nodes, codes, NODE_GROUP_COLUMNS)
+        self._node_visits = self._visits(codes, nodes, "track_date", overlap_cols)
+
+        days = self._segment_visits["day"]
+        self.first_date, self.last_date = days[[0, -1]].astype("datetime64[D]").tolist()
+
+        # track features are built once, a date range selects a slice of them
+        gpx = gpx.assign(track_date=pd.to_datetime(gpx["track_date"]))
+        features = gpx.__geo_interface__["features"]
+        order = np.argsort(gpx["track_date"].to_numpy(), kind="stable")
+        self._gpx_features = [features[i] for i in order]
+        self._gpx_bounds = gpx.geometry.bounds.to_numpy()[order]
+        self._gpx_days = _day_numbers(gpx["track_date"])[order]
+
+    @staticmethod
+    def _groups(frame, codes, group_cols):
+        """Return the group columns and geometry of the first row of each group, in group order."""
+        _, first_rows = np.unique(codes, return_index=True)
+        return frame.iloc[first_rows][[*group_cols, frame.geometry.name]].reset_index(drop=True)
+
+    @staticmethod
+    def _visits(codes, frame, unit_col, overlap_cols):
+        """
+        Reduce matched rows to one row per (group, `unit_col`) with the best
+        overlaps, and return them sorted by date as a dict of NumPy arrays.
+        """
+        visits = pd.DataFrame({
+            "code": codes,
+            "unit": frame[unit_col].to_numpy(),
+            "day": _day_numbers(frame["track_date"]),
+            **{col: frame[col].to_numpy() for col in overlap_cols}
+        })
+        visits = visits.groupby(["code", "unit"], sort=False).agg(
+            {"day": "min", **{col: "max" for col in overlap_cols}}
+        ).reset_index().sort_values("day", kind="stable")
+        return {col: visits[col].to_numpy() for col in visits.columns if col != "unit"}
+
+    @staticmethod
+    def _count(visits, n_groups, first_day, last_day, min_overlap, overlap_col):
+        """
+        Count the visits per group between two days (inclusive) reaching
+        `min_overlap`, with their best overlap and first and last day.
+        """
+        days = visits["day"]
+        lo, hi = np.searchsorted(days, first_day, "left"), np.searchsorted(days, last_day, "right")
+        kept = visits[overlap_col][lo:hi] >= min_overlap
+        codes = visits["code"][lo:hi][kept]
+        overlaps = visits[overlap_col][lo:hi][kept]
+        days = days[lo:hi][kept]
+
+        counts = np.bincount(codes, minlength=n_groups)
+        best = np.zeros(n_groups)
+        np.maximum.at(best, codes, overlaps)
+        first = np.full(n_groups, np.iinfo(np.int64).max)
+        last = np.full(n_groups, np.iinfo(np.int64).min)
+        np.minimum.at(first, codes, days)
+        np.maximum.at(last, codes, days)
+        return counts, best, first, last
+
+    def filter(self, start_date, end_date, min_overlap, overlap_col):
+        """
+        Aggregate the segment and node visits in a date range.
+
+        Args:
+            start_date (date): First date of the range (inclusive).
+            end_date (date): Last date of the range (inclusive).
+            min_overlap (float): Minimum overlap fraction of a visit.
+            overlap_col (str): Overlap column of the buffer distance in use.
+
+        Returns:
+            tuple:
+                GeoDataFrame: Visited segments, with `length_km`,
+                    `count_track` (tracks), `max_overlap_percentage`,
+                    `first_date` and `last_date` (YYYY-MM-DD) columns.
+                GeoDataFrame: Visited nodes, with `count_track` (dates),
+                    `first_date` and `last_date` columns.
+                dict: GeoJSON FeatureCollection of the tracks in the range.
+        """
+        first_day, last_day = _day_numbers([start_date, end_date])
+
+        counts, best, first, last = self._count(
+            self._segment_visits, len(self.segments), first_day, last_day, min_overlap, overlap_col
+        )
+        visited = counts > 0
+        agg_seg = self.segments[visited].assign(
+            count_track=counts[visited],
+            max_overlap_percentage=best[visited],
+            first_date=_day_strings(first[visited]),
+            last_date=_day_strings(last[visited])
+        ).reset_index(drop=True)
+
+        counts, _, first, last = self._count(
+            self._node_visits, len(self.nodes), first_day, last_day, min_overlap, overlap_col
+        )
+        visited = counts > 0
+        agg_nodes = self.nodes[visited].assign(
+            count_track=counts[visited],
+            first_date=_day_strings(first[visited]),
+            last_date=_day_strings(last[visited])
+        ).reset_index(drop=True)
+
+        lo = np.searchsorted(self._gpx_days, first_day, "left")
+        hi = np.searchsorted(self._gpx_days, last_day, "right")
+        gpx = {"type": "FeatureCollection", "features": self._gpx_features[lo:hi]}
+        if hi > lo:
+            bounds = self._gpx_bounds[lo:hi]
+            gpx["bbox"] = [*bounds[:, :2].min(axis=0), *bounds[:, 2:].max(axis=0)]
+        return agg_seg, agg_nodes, gpx
+
 def create_result_zip(segments_path, nodes_path, gpx_path):
     """
     Zip the two GeoJSON result files and return the zip file path.
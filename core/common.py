@@ -2,16 +2,78 @@
 import geopandas as gpd
 import pandas as pd
 import os
+import numpy as np
+import shapely
 
 # ---------- Constants ----------
 # files and folders
 UPLOAD_FOLDER = "app/uploads"
 STATIC_FOLDER = "app/static"
+CACHE_FOLDER = "app/cache"
 
 # geoprocessing
 MULTILINE_GEOJSON_PATH = 'data/processed/gdf_multiline.geojson'
 MULTILINE_PROJECTED_PARQUET_PATH = 'data/processed/gdf_multiline_projected.parquet'
 POINT_PROJECTED_PARQUET_PATH = 'data/processed/gdf_point_projected.parquet'
+CORRIDOR_PROJECTED_PARQUET_PATH = 'data/processed/gdf_corridor_projected.parquet'
+NETWORK_MASK_PARQUET_PATH = 'data/processed/gdf_network_mask_projected.parquet'
+NETWORK_GRAPH_PARQUET_PATH = 'data/processed/network_graph.parquet'
 SIMPLIFY_TOLERANCE_M = 10 #  meters, drastically improves memory and speed
 BUFFER_DISTANCE_M = 20  # meters, for spatial buffer
+BUFFER_DISTANCES_M = (10, 20, 30)  # meters, buffers whose overlap is computed too, incl. BUFFER_DISTANCE_M
+OVERLAP_COLUMNS = {d: f"overlap_percentage_{d}m" for d in BUFFER_DISTANCES_M}
+# meters, minimum spacing along a track between the trackpoints kept after parsing (0 keeps
+# all); about every other point of a 1 Hz ride goes, while the line shifts too little to move
+# segment overlaps by more than a few percent, even in the narrowest buffer
+DECIMATE_MIN_SPACING_M = min(BUFFER_DISTANCES_M) * 3 / 4
+CORRIDOR_SIMPLIFY_M = 1  # meters, simplification of the precomputed segment buffers
 INTERSECT_THRESHOLD = 0.75 # minimum overlap fraction for matching 
+MIN_OVERLAP_FRACTION = 0.25 # lowest overlap fraction kept, so the threshold can be tuned afterwards
+NETWORK_MASK_CELL_M = 2000  # meters, grid cell size of the network extent mask
+
+# ---------- Helpers ----------
+def build_network_mask(segments, cell_size=NETWORK_MASK_CELL_M, margin=max(BUFFER_DISTANCES_M)):
+    """
+    Build a grid mask of the extent of the bike network: the union of all
+    grid cells holding a (densified) segment vertex, dilated by `margin` plus
+    half the vertex spacing, so every segment point lies at least `margin`
+    inside the mask.
+
+    Args:
+        segments (GeoSeries): Projected segment geometries.
+        cell_size (float): Grid cell size in CRS units.
+        margin (float): Dilation of the mask in CRS units, at least the
+            widest buffer distance used for matching.
+
+    Returns:
+        Polygon | MultiPolygon: The network mask.
+    """
+    spacing = cell_size / 10
+    coords = shapely.get_coordinates(shapely.segmentize(segments.values, spacing))
+    cells = np.unique(np.floor(coords / cell_size).astype(np.int64), axis=0)
+    boxes = shapely.box(
+        cells[:, 0] * cell_size, cells[:, 1] * cell_size,
+        (cells[:, 0] + 1) * cell_size, (cells[:, 1] + 1) * cell_size
+    )
+    return shapely.union_all(boxes).buffer(margin + spacing / 2, join_style="mitre")
+
+def build_network_graph(segments):
+    """
+    Build the node-segment adjacency of the bike network: one row per segment
+    end node, sorted by node. The `osm_id` column is the column index array of
+    a CSR adjacency matrix, whose row pointers follow from the runs of equal
+    `node_id`.
+
+    Args:
+        segments (DataFrame): Segments with `osm_id`, `osm_id_from` and
+            `osm_id_to` columns.
+
+    Returns:
+        DataFrame: `node_id` and `osm_id` (of the segment) columns.
+    """
+    edges = pd.concat([
+        segments[[end, "osm_id"]].set_axis(["node_id", "osm_id"], axis=1)
+        for end in ("osm_id_from", "osm_id_to")
+    ], ignore_index=True)
+    edges = edges.dropna(subset=["node_id"]).drop_duplicates()
+    return edges.sort_values(["node_id", "osm_id"], kind="stable").reset_index(drop=True)
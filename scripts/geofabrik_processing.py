@@ -222,6 +222,30 @@ def process_osm_data(tqdm_params):
     gdf_multiline_projected['geometry'] = gdf_multiline_projected['geometry'].simplify(tolerance=SIMPLIFY_TOLERANCE_M, preserve_topology=True)
     gdf_multiline_projected["length_km"] = gdf_multiline_projected.geometry.length / 1000.0
 
+    # Buffer each segment once here, so the app's corridor matching doesn't have to
+    print("[INFO] Buffering segment corridors...")
+    gdf_corridor_projected = gpd.GeoDataFrame(
+        {"osm_id": gdf_multiline_projected["osm_id"], "buffer_distance_m": BUFFER_DISTANCE_M},
+        geometry=gdf_multiline_projected.geometry.buffer(BUFFER_DISTANCE_M).simplify(CORRIDOR_SIMPLIFY_M),
+        crs=gdf_multiline_projected.crs
+    )
+
+    # Grid mask of the network extent, used by the app to skip tracks (or parts) outside it
+    print("[INFO] Building network extent mask...")
+    gdf_network_mask_projected = gpd.GeoDataFrame(
+        {
+            "cell_size_m": [NETWORK_MASK_CELL_M],
+            "buffer_distance_m": [max(BUFFER_DISTANCES_M)],
+            "n_segments": [len(gdf_multiline_projected)]
+        },
+        geometry=[build_network_mask(gdf_multiline_projected.geometry)],
+        crs=gdf_multiline_projected.crs
+    )
+
+    # Node-segment adjacency (CSR order) of the network graph, used by the app's graph matching
+    print("[INFO] Building network graph adjacency...")
+    df_network_graph = build_network_graph(gdf_multiline_projected)
+
     # Convert the enriched result back to WGS84
     print("[INFO] Converting back to WGS84 (EPSG:4326)...")
     gdf_multiline = gdf_multiline_projected.to_crs(epsg=4326)
@@ -238,6 +262,9 @@ def process_osm_data(tqdm_params):
     gdf_multiline.to_file(MULTILINE_GEOJSON_PATH, driver='GeoJSON')
     gdf_multiline_projected.to_parquet(MULTILINE_PROJECTED_PARQUET_PATH, engine="pyarrow")
     gdf_point_projected.to_parquet(POINT_PROJECTED_PARQUET_PATH, engine="pyarrow")
+    gdf_corridor_projected.to_parquet(CORRIDOR_PROJECTED_PARQUET_PATH, engine="pyarrow")
+    gdf_network_mask_projected.to_parquet(NETWORK_MASK_PARQUET_PATH, engine="pyarrow")
+    df_network_graph.to_parquet(NETWORK_GRAPH_PARQUET_PATH, engine="pyarrow")
     print("[INFO] All outputs saved successfully.")
 
 if __name__ == "__main__":